@@ -3,101 +3,12 @@
 """
 
 import os
+import sys
 from pathlib import Path
 
 
-def create_directory_structure():
-    """Создает структуру папок для проекта."""
-    
-    # Определяем структуру папок
-    structure = {
-        'data': {
-            'raw': 'Исходные данные (Markdown файлы)',
-            'processed': 'Обработанные данные (JSON, JSONL)',
-            'output': 'Выходные файлы после обработки'
-        },
-        'scripts': {
-            '': 'Скрипты для обработки данных'
-        },
-        'docs': {
-            '': 'Документация проекта'
-        },
-        'tests': {
-            '': 'Тесты для модулей'
-        },
-        'examples': {
-            '': 'Примеры использования'
-        },
-        'config': {
-            '': 'Конфигурационные файлы'
-        },
-        'logs': {
-            '': 'Логи работы системы'
-        }
-    }
-    
-    print("=" * 60)
-    print("Создание структуры папок проекта")
-    print("=" * 60)
-    
-    base_path = Path('.')
-    
-    for main_folder, subfolders in structure.items():
-        main_path = base_path / main_folder
-        
-        # Создаем главную папку
-        main_path.mkdir(exist_ok=True)
-        print(f"\n[OK] Создана папка: {main_folder}/")
-        
-        # Создаем README в главной папке с описанием
-        readme_path = main_path / 'README.md'
-        if not readme_path.exists():
-            with open(readme_path, 'w', encoding='utf-8') as f:
-                f.write(f"# {main_folder.capitalize()}\n\n")
-                if isinstance(subfolders, dict) and subfolders.get(''):
-                    f.write(f"{subfolders['']}\n")
-        
-        # Создаем подпапки
-        if isinstance(subfolders, dict):
-            for subfolder, description in subfolders.items():
-                if subfolder:  # Пропускаем пустую строку
-                    sub_path = main_path / subfolder
-                    sub_path.mkdir(exist_ok=True)
-                    print(f"  [OK] Создана подпапка: {main_folder}/{subfolder}/")
-                    
-                    # Создаем README в подпапке
-                    sub_readme_path = sub_path / 'README.md'
-                    if not sub_readme_path.exists():
-                        with open(sub_readme_path, 'w', encoding='utf-8') as f:
-                            f.write(f"# {subfolder.capitalize()}\n\n{description}\n")
-    
-    # Создаем .gitkeep файлы для пустых папок
-    empty_folders = [
-        'data/raw',
-        'data/processed',
-        'data/output',
-        'logs'
-    ]
-    
-    for folder in empty_folders:
-        gitkeep_path = base_path / folder / '.gitkeep'
-        gitkeep_path.parent.mkdir(parents=True, exist_ok=True)
-        if not gitkeep_path.exists():
-            gitkeep_path.touch()
-            print(f"  [OK] Создан .gitkeep в {folder}/")
-    
-    print("\n" + "=" * 60)
-    print("[SUCCESS] Структура папок создана!")
-    print("=" * 60)
-    
-    # Выводим структуру
-    print("\nСтруктура проекта:")
-    print_tree_structure()
-
-
-def print_tree_structure():
-    """Выводит структуру проекта в виде дерева."""
-    structure_text = """
+# Структура проекта для вывода (только ASCII, чтобы не зависеть от кодировки консоли)
+_TREE_STRUCTURE = """
 Project structure:
 .
 +-- data/                      Data files
@@ -137,13 +48,103 @@ Project structure:
 +-- requirements.txt           Main dependencies
 +-- requirements_rag.txt       RAG dependencies
 -- README.md                   Main README
+
 """
+
+
+# Структура папок: (папка, описание или None, ((подпапка, описание), ...))
+_DIRECTORY_STRUCTURE = (
+    ('data', None, (
+        ('raw', 'Исходные данные (Markdown файлы)'),
+        ('processed', 'Обработанные данные (JSON, JSONL)'),
+        ('output', 'Выходные файлы после обработки'),
+    )),
+    ('scripts', 'Скрипты для обработки данных', ()),
+    ('docs', 'Документация проекта', ()),
+    ('tests', 'Тесты для модулей', ()),
+    ('examples', 'Примеры использования', ()),
+    ('config', 'Конфигурационные файлы', ()),
+    ('logs', 'Логи работы системы', ()),
+)
+
+
+def _create_file(path: Path, content: str):
+    """Создает файл с содержимым одной записью, если он еще не существует."""
     try:
-        print(structure_text)
-    except:
-        # Если не получается вывести, просто показываем список
-        print("\nProject structure created successfully!")
-        print("See PROJECT_STRUCTURE.md for details")
+        with open(path, 'x', encoding='utf-8') as f:
+            f.write(content)
+    except FileExistsError:
+        pass
+
+
+def create_directory_structure():
+    """Создает структуру папок для проекта."""
+    
+    print("=" * 60)
+    print("Создание структуры папок проекта")
+    print("=" * 60)
+    
+    base_path = Path('.')
+    
+    # Сообщения о создании накапливаем и выводим одной записью
+    messages = []
+    
+    for main_folder, main_description, subfolders in _DIRECTORY_STRUCTURE:
+        main_path = base_path / main_folder
+        
+        # Создаем главную папку
+        main_path.mkdir(parents=True, exist_ok=True)
+        messages.append(f"\n[OK] Создана папка: {main_folder}/")
+        
+        # Создаем README в главной папке с описанием
+        # (режим 'x' создает файл атомарно, без отдельной проверки exists)
+        readme_body = f"# {main_folder.capitalize()}\n\n"
+        if main_description:
+            readme_body += f"{main_description}\n"
+        _create_file(main_path / 'README.md', readme_body)
+        
+        # Создаем подпапки
+        for subfolder, description in subfolders:
+            sub_path = main_path / subfolder
+            sub_path.mkdir(parents=True, exist_ok=True)
+            messages.append(f"  [OK] Создана подпапка: {main_folder}/{subfolder}/")
+            
+            # Создаем README в подпапке
+            _create_file(sub_path / 'README.md',
+                         f"# {subfolder.capitalize()}\n\n{description}\n")
+    
+    # Создаем .gitkeep файлы для пустых папок
+    empty_folders = [
+        'data/raw',
+        'data/processed',
+        'data/output',
+        'logs'
+    ]
+    
+    for folder in empty_folders:
+        gitkeep_path = base_path / folder / '.gitkeep'
+        gitkeep_path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            open(gitkeep_path, 'xb').close()
+            messages.append(f"  [OK] Создан .gitkeep в {folder}/")
+        except FileExistsError:
+            pass
+    
+    if messages:
+        sys.stdout.write('\n'.join(messages) + '\n')
+    
+    print("\n" + "=" * 60)
+    print("[SUCCESS] Структура папок создана!")
+    print("=" * 60)
+    
+    # Выводим структуру
+    print("\nСтруктура проекта:")
+    print_tree_structure()
+
+
+def print_tree_structure():
+    """Выводит структуру проекта в виде дерева."""
+    sys.stdout.write(_TREE_STRUCTURE)
 
 
 if __name__ == "__main__":
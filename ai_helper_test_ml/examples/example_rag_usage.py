@@ -66,21 +66,22 @@ def example_search_and_answer():
     print("Примеры использования RAG системы:")
     print("=" * 60)
     
-    for query in queries:
+    # Эмбеддинги для всех запросов генерируем одним батчем
+    query_embeddings = embedding_generator.generate(queries)
+    
+    for query, query_embedding in zip(queries, query_embeddings):
         print(f"\n[QUERY] {query}")
         print("-" * 60)
         
-        # Поиск релевантных фрагментов
-        chunks = rag.search_relevant_chunks(query, top_k=3)
+        # Поиск релевантных фрагментов и генерация ответа по ним
+        result = rag.ask_with_embedding(query, query_embedding, top_k=3)
+        chunks = result['relevant_chunks']
         print(f"\n[SEARCH] Найдено {len(chunks)} релевантных фрагментов:")
         
         for i, chunk in enumerate(chunks, 1):
             print(f"\n  Фрагмент {i} (релевантность: {chunk.get('score', 0):.3f}):")
             print(f"    {chunk.get('text', chunk.get('answer', ''))[:200]}...")
         
-        # Генерация ответа
-        result = rag.ask(query, top_k=3)
-        
         print(f"\n[ANSWER] {result['answer']}")
         print("-" * 60)
     
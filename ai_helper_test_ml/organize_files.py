@@ -2,8 +2,38 @@
 Скрипт для организации существующих файлов в структуру папок.
 """
 
+import os
+import sys
+import errno
 import shutil
+import logging
 from pathlib import Path
+from typing import Set
+
+
+logger = logging.getLogger(__name__)
+
+
+# Директории, которые уже созданы в текущем процессе
+_ensured_dirs: Set[Path] = set()
+
+
+def _ensure_dir(path: Path):
+    """Создает директорию один раз, повторные вызовы не обращаются к ФС."""
+    if path in _ensured_dirs:
+        return
+    path.mkdir(parents=True, exist_ok=True)
+    _ensured_dirs.add(path)
+
+
+def _move_file(source_path: Path, target_path: Path):
+    """Перемещает файл через os.rename, копируя только при переносе между ФС."""
+    try:
+        os.rename(source_path, target_path)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        shutil.move(str(source_path), str(target_path))
 
 
 def organize_files():
@@ -46,25 +76,30 @@ def organize_files():
     moved_files = []
     skipped_files = []
     
+    # Один снимок текущей директории вместо stat для каждого файла.
+    # Тип записи берется из readdir и не требует дополнительного stat
+    with os.scandir('.') as entries:
+        existing_files = {entry.name for entry in entries if entry.is_file()}
+    
     for file_name, target_dir in file_movements.items():
         source_path = Path(file_name)
         target_path = Path(target_dir) / file_name
         
-        if source_path.exists():
+        if file_name in existing_files:
             try:
                 # Создаем целевую директорию если её нет
-                target_path.parent.mkdir(parents=True, exist_ok=True)
+                _ensure_dir(target_path.parent)
                 
                 # Перемещаем файл
-                shutil.move(str(source_path), str(target_path))
+                _move_file(source_path, target_path)
                 moved_files.append((file_name, target_dir))
-                print(f"[OK] Перемещен: {file_name} -> {target_dir}")
+                logger.info("Перемещен: %s -> %s", file_name, target_dir)
             except Exception as e:
-                print(f"[ERROR] Ошибка при перемещении {file_name}: {e}")
+                logger.error("Ошибка при перемещении %s: %s", file_name, e)
                 skipped_files.append(file_name)
         else:
             skipped_files.append(file_name)
-            print(f"[SKIP] Файл не найден: {file_name}")
+            logger.info("Файл не найден: %s", file_name)
     
     print("\n" + "=" * 60)
     print(f"[SUMMARY] Перемещено файлов: {len(moved_files)}")
@@ -83,5 +118,6 @@ def organize_files():
 
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(message)s', stream=sys.stdout)
     organize_files()
 
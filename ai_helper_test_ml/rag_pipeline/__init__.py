@@ -2,14 +2,17 @@
 RAG Pipeline - Полный пайплайн для подготовки данных и работы с векторными БД.
 """
 
-from .data_cleaner import DataCleaner
+from .data_cleaner import DataCleaner, RecordStatistics
 from .text_chunker import TextChunker, Chunk
 from .embeddings import (
     EmbeddingGenerator,
     OpenAIEmbeddingGenerator,
     SentenceTransformerEmbeddingGenerator,
     create_embedding_generator,
-    add_embeddings_to_records
+    add_embeddings_to_records,
+    add_embedding_matrix_to_records,
+    add_embeddings_streaming,
+    DiskEmbeddingCache
 )
 from .vector_db import (
     VectorDB,
@@ -21,6 +24,7 @@ from .rag_system import RAGSystem
 
 __all__ = [
     'DataCleaner',
+    'RecordStatistics',
     'TextChunker',
     'Chunk',
     'EmbeddingGenerator',
@@ -28,6 +32,9 @@ __all__ = [
     'SentenceTransformerEmbeddingGenerator',
     'create_embedding_generator',
     'add_embeddings_to_records',
+    'add_embedding_matrix_to_records',
+    'add_embeddings_streaming',
+    'DiskEmbeddingCache',
     'VectorDB',
     'PineconeVectorDB',
     'QdrantVectorDB',
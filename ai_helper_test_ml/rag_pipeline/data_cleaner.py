@@ -3,17 +3,113 @@
 """
 
 import re
+import sys
+import hashlib
 import unicodedata
-from typing import List, Dict, Any, Set
-from collections import defaultdict
+from typing import List, Dict, Any, Set, Tuple, Iterable, Iterator
+from collections import Counter
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import xxhash  # Быстрый некриптографический хэш для отпечатков (опционально)
+except ImportError:
+    xxhash = None
+
+
+# Предкомпилированные регулярные выражения для normalize_text
+_MULTI_PUNCT_RE = re.compile(r'([.!?])\1+')
+_SP_AFTER_RE = re.compile(r'([,.!?;:])([^\s])')
+
+# Лишний знак вопроса после вопросительного слова внутри вопроса
+_INNER_QUESTION_MARK_RE = re.compile(r'(как|что|где)\?')
+
+# Пары замен для удаления пробела перед знаком препинания. После схлопывания
+# пробелов перед знаком может стоять только один пробел, поэтому достаточно
+# str.replace без регулярного выражения
+_SPACE_BEFORE_PUNCT = tuple((' ' + p, p) for p in ',.!?;:')
+
+# Размер порции записей при подсчете статистики по итератору
+_STATS_BATCH_SIZE = 4096
+
+
+def _fingerprint(text: str) -> int:
+    """
+    Возвращает 64-битный отпечаток строки для проверки дубликатов.
+    
+    Используется XXH3 (если установлен xxhash), иначе BLAKE2b. Отпечатки
+    сравниваются только в пределах одного запуска, поэтому выбор хэша
+    не влияет на результат очистки.
+    """
+    if xxhash is not None:
+        return xxhash.xxh3_64_intdigest(text)
+    return int.from_bytes(
+        hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'little'
+    )
+
+
+class RecordStatistics:
+    """
+    Накопитель статистики по записям, обновляемый по одной записи.
+    
+    Позволяет считать статистику в потоке (чтение -> очистка -> запись),
+    не собирая все записи в список.
+    """
+    
+    def __init__(self):
+        self.total = 0
+        self.categories: Counter = Counter()
+        self.sections: Counter = Counter()
+        self.total_question_length = 0
+        self.total_answer_length = 0
+    
+    def add(self, record: Dict[str, Any]):
+        """Учитывает запись в статистике."""
+        self.total += 1
+        if 'category' in record:
+            self.categories[record['category']] += 1
+        if 'section' in record:
+            self.sections[record['section']] += 1
+        if 'question' in record:
+            self.total_question_length += len(record['question'])
+        if 'answer' in record:
+            self.total_answer_length += len(record['answer'])
+    
+    def update(self, records: List[Dict[str, Any]]):
+        """
+        Учитывает порцию записей.
+        
+        Каждое поле агрегируется отдельным проходом (Counter.update и sum
+        по генераторам выполняются в C), что примерно вдвое быстрее
+        вызова add для каждой записи.
+        """
+        self.total += len(records)
+        self.categories.update(r['category'] for r in records if 'category' in r)
+        self.sections.update(r['section'] for r in records if 'section' in r)
+        self.total_question_length += sum(len(r['question']) for r in records if 'question' in r)
+        self.total_answer_length += sum(len(r['answer']) for r in records if 'answer' in r)
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Возвращает статистику в формате DataCleaner.get_statistics."""
+        total = self.total
+        return {
+            'total': total,
+            'categories': dict(self.categories),
+            'sections': dict(self.sections),
+            'avg_question_length': self.total_question_length / total if total else 0,
+            'avg_answer_length': self.total_answer_length / total if total else 0,
+        }
 
 
 class DataCleaner:
     """Класс для очистки данных от дубликатов, опечаток и нормализации формата."""
     
     def __init__(self):
-        self.seen_texts: Set[str] = set()
-        self.seen_questions: Set[str] = set()
+        # Храним 64-битные отпечатки вместо полных строк для экономии памяти
+        self.seen_texts: Set[int] = set()
+        self.seen_questions: Set[int] = set()
+        # Число дубликатов, отброшенных последней очисткой
+        self.duplicates_removed = 0
     
     def normalize_text(self, text: str) -> str:
         """
@@ -31,22 +127,22 @@ class DataCleaner:
         # Нормализуем unicode символы (например, разные типы кавычек)
         text = unicodedata.normalize('NFKC', text)
         
-        # Убираем лишние пробелы
-        text = re.sub(r'\s+', ' ', text)
-        
-        # Убираем пробелы в начале и конце
-        text = text.strip()
+        # Убираем лишние пробелы, а также пробелы в начале и конце.
+        # split/join выполняются в C и эквивалентны re.sub(r'\s+', ' ') + strip()
+        text = ' '.join(text.split())
         
-        # Нормализуем знаки препинания
-        text = re.sub(r'\.{2,}', '.', text)  # Множественные точки
-        text = re.sub(r'\?{2,}', '?', text)  # Множественные вопросительные знаки
-        text = re.sub(r'!{2,}', '!', text)   # Множественные восклицательные знаки
+        # Нормализуем знаки препинания: множественные точки,
+        # вопросительные и восклицательные знаки за один проход
+        if '..' in text or '??' in text or '!!' in text:
+            text = _MULTI_PUNCT_RE.sub(r'\1', text)
         
         # Убираем пробелы перед знаками препинания
-        text = re.sub(r'\s+([,.!?;:])', r'\1', text)
+        for pattern, replacement in _SPACE_BEFORE_PUNCT:
+            if pattern in text:
+                text = text.replace(pattern, replacement)
         
         # Добавляем пробелы после знаков препинания если их нет
-        text = re.sub(r'([,.!?;:])([^\s])', r'\1 \2', text)
+        text = _SP_AFTER_RE.sub(r'\1 \2', text)
         
         return text
     
@@ -68,10 +164,9 @@ class DataCleaner:
         # Убираем знак вопроса если он есть в начале или множественные в конце
         question = question.strip().rstrip('?')
         
-        # Исправляем общие опечатки
-        question = question.replace('как?', 'как')
-        question = question.replace('что?', 'что')
-        question = question.replace('где?', 'где')
+        # Исправляем общие опечатки (одним проходом и только если есть '?')
+        if '?' in question:
+            question = _INNER_QUESTION_MARK_RE.sub(r'\1', question)
         
         # Добавляем знак вопроса в конец если его нет
         if question and not question.endswith('?'):
@@ -120,29 +215,30 @@ class DataCleaner:
         normalized_question_lower = normalized_question.lower()
         
         # Простая проверка на точное совпадение
-        if normalized_question_lower in self.seen_questions:
+        if _fingerprint(normalized_question_lower) in self.seen_questions:
             return True
         
         # Проверяем по комбинации вопроса и ответа
         text = record.get('text', '')
         normalized_text = self.normalize_text(text).lower()
         
-        if normalized_text in self.seen_texts:
+        if _fingerprint(normalized_text) in self.seen_texts:
             return True
         
         return False
     
-    def clean_record(self, record: Dict[str, Any]) -> Dict[str, Any]:
+    def clean_record(self, record: Dict[str, Any], copy: bool = True) -> Dict[str, Any]:
         """
         Очищает одну запись от опечаток и нормализует формат.
         
         Args:
             record: Исходная запись
+            copy: Копировать ли запись (при False запись изменяется на месте)
             
         Returns:
             Очищенная запись
         """
-        cleaned = record.copy()
+        cleaned = record.copy() if copy else record
         
         # Нормализуем поля
         if 'question' in cleaned:
@@ -155,26 +251,56 @@ class DataCleaner:
         if 'question' in cleaned and 'answer' in cleaned:
             cleaned['text'] = f"Вопрос: {cleaned['question']}\nОтвет: {cleaned['answer']}"
         
-        # Нормализуем категорию и раздел
+        # Нормализуем категорию и раздел. Значений немного, поэтому интернируем
+        # их, чтобы все записи ссылались на один объект строки
         if 'category' in cleaned:
-            cleaned['category'] = self.normalize_text(cleaned['category']).strip()
+            cleaned['category'] = sys.intern(self.normalize_text(cleaned['category']).strip())
         
         if 'section' in cleaned:
-            cleaned['section'] = self.normalize_text(cleaned['section']).strip()
+            cleaned['section'] = sys.intern(self.normalize_text(cleaned['section']).strip())
         
         # Обновляем metadata
         if 'metadata' in cleaned:
-            cleaned['metadata'] = cleaned['metadata'].copy()
-            if 'category' in cleaned['metadata']:
-                cleaned['metadata']['category'] = cleaned.get('category', '')
-            if 'section' in cleaned['metadata']:
-                cleaned['metadata']['section'] = cleaned.get('section', '')
+            if copy:
+                cleaned['metadata'] = cleaned['metadata'].copy()
+            metadata = cleaned['metadata']
+            if 'category' in metadata:
+                metadata['category'] = cleaned.get('category', '')
+            if 'section' in metadata:
+                metadata['section'] = cleaned.get('section', '')
         
         return cleaned
     
+    def clean_record_with_keys(self, record: Dict[str, Any],
+                               copy: bool = True) -> Tuple[Dict[str, Any], int, int]:
+        """
+        Очищает запись и вычисляет ключи для проверки дубликатов.
+        
+        Args:
+            record: Исходная запись
+            copy: Копировать ли запись (при False запись изменяется на месте)
+            
+        Returns:
+            Кортеж (очищенная запись, отпечаток вопроса, отпечаток текста)
+        """
+        cleaned = self.clean_record(record, copy=copy)
+        
+        # Вопрос уже нормализован в clean_record. Текст тоже собран из
+        # нормализованных полей, если в записи есть вопрос и ответ;
+        # иначе он не пересоздавался и его нужно нормализовать
+        question_key = _fingerprint(cleaned.get('question', '').lower())
+        text = cleaned.get('text', '')
+        if 'question' not in cleaned or 'answer' not in cleaned:
+            text = self.normalize_text(text)
+        text_key = _fingerprint(text.lower())
+        
+        return cleaned, question_key, text_key
+    
     def clean_records(self, records: List[Dict[str, Any]], 
                      remove_duplicates: bool = True,
-                     similarity_threshold: float = 0.9) -> List[Dict[str, Any]]:
+                     similarity_threshold: float = 0.9,
+                     num_workers: int = 1,
+                     copy: bool = True) -> List[Dict[str, Any]]:
         """
         Очищает список записей от дубликатов и нормализует формат.
         
@@ -182,79 +308,99 @@ class DataCleaner:
             records: Список записей для очистки
             remove_duplicates: Удалять ли дубликаты
             similarity_threshold: Порог схожести для определения дубликатов
+            num_workers: Количество процессов для нормализации (1 - без пула)
+            copy: Копировать ли записи. При False записи изменяются на месте,
+                что экономит память, если исходный список больше не нужен
             
         Returns:
             Очищенный список записей
         """
+        # Нормализация записей не зависит от других записей, поэтому её можно
+        # выполнять параллельно; проверка дубликатов идет последовательно
+        if num_workers > 1:
+            with ProcessPoolExecutor(max_workers=num_workers) as executor:
+                results = list(executor.map(_clean_record_with_keys, records, chunksize=512))
+        else:
+            results = (self.clean_record_with_keys(record, copy=copy) for record in records)
+        
+        cleaned_records = list(self._drop_duplicates(results, remove_duplicates))
+        
+        if remove_duplicates:
+            print(f"[INFO] Удалено дубликатов: {self.duplicates_removed}")
+        
+        return cleaned_records
+    
+    def iter_clean_records(self, records: Iterable[Dict[str, Any]],
+                           remove_duplicates: bool = True,
+                           copy: bool = True) -> Iterator[Dict[str, Any]]:
+        """
+        Лениво очищает записи (генератор).
+        
+        В отличие от clean_records, ни исходные, ни очищенные записи не
+        собираются в список: в памяти остаются только 64-битные отпечатки
+        для проверки дубликатов. Число отброшенных дубликатов доступно в
+        duplicates_removed после исчерпания генератора.
+        
+        Args:
+            records: Итерируемый источник записей (например, чтение JSONL)
+            remove_duplicates: Удалять ли дубликаты
+            copy: Копировать ли записи (при False записи изменяются на месте)
+            
+        Yields:
+            Очищенные записи в исходном порядке
+        """
+        results = (self.clean_record_with_keys(record, copy=copy) for record in records)
+        yield from self._drop_duplicates(results, remove_duplicates)
+    
+    def _drop_duplicates(self, results: Iterable[Tuple[Dict[str, Any], int, int]],
+                         remove_duplicates: bool) -> Iterator[Dict[str, Any]]:
+        """Пропускает очищенные записи, отбрасывая дубликаты по отпечаткам."""
         self.seen_texts.clear()
         self.seen_questions.clear()
+        self.duplicates_removed = 0
         
-        cleaned_records = []
-        duplicates_removed = 0
+        # Дубликаты отсеиваются одним проходом по множествам 64-битных
+        # отпечатков (O(1) на запись, без попарных сравнений строк)
+        seen_questions = self.seen_questions
+        seen_texts = self.seen_texts
         
-        for record in records:
-            # Очищаем запись
-            cleaned = self.clean_record(record)
-            
+        for cleaned, question_key, text_key in results:
             # Проверяем на дубликаты
-            if remove_duplicates and self.is_duplicate(cleaned, similarity_threshold):
-                duplicates_removed += 1
+            if remove_duplicates and (question_key in seen_questions
+                                      or text_key in seen_texts):
+                self.duplicates_removed += 1
                 continue
             
-            # Добавляем в список уникальных
-            normalized_question = self.normalize_question(cleaned.get('question', '')).lower()
-            normalized_text = self.normalize_text(cleaned.get('text', '')).lower()
-            
-            self.seen_questions.add(normalized_question)
-            self.seen_texts.add(normalized_text)
+            # Добавляем в множества уникальных
+            seen_questions.add(question_key)
+            seen_texts.add(text_key)
             
-            cleaned_records.append(cleaned)
-        
-        if remove_duplicates:
-            print(f"[INFO] Удалено дубликатов: {duplicates_removed}")
-        
-        return cleaned_records
+            yield cleaned
     
-    def get_statistics(self, records: List[Dict[str, Any]]) -> Dict[str, Any]:
+    def get_statistics(self, records: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
         """
         Получает статистику по записям.
         
         Args:
-            records: Список записей
+            records: Записи (список или любой итерируемый источник;
+                проходится один раз)
             
         Returns:
             Словарь со статистикой
         """
-        stats = {
-            'total': len(records),
-            'categories': defaultdict(int),
-            'sections': defaultdict(int),
-            'avg_question_length': 0,
-            'avg_answer_length': 0,
-        }
-        
-        total_question_length = 0
-        total_answer_length = 0
-        
-        for record in records:
-            # Статистика по категориям и разделам
-            if 'category' in record:
-                stats['categories'][record['category']] += 1
-            if 'section' in record:
-                stats['sections'][record['section']] += 1
-            
-            # Средние длины
-            if 'question' in record:
-                total_question_length += len(record['question'])
-            if 'answer' in record:
-                total_answer_length += len(record['answer'])
-        
-        if stats['total'] > 0:
-            stats['avg_question_length'] = total_question_length / stats['total']
-            stats['avg_answer_length'] = total_answer_length / stats['total']
-        
-        stats['categories'] = dict(stats['categories'])
-        stats['sections'] = dict(stats['sections'])
-        
-        return stats
+        stats = RecordStatistics()
+        if isinstance(records, list):
+            stats.update(records)
+        else:
+            # Итератор обрабатывается порциями: агрегация остается в C,
+            # а в памяти одновременно не больше _STATS_BATCH_SIZE записей
+            records = iter(records)
+            while batch := list(islice(records, _STATS_BATCH_SIZE)):
+                stats.update(batch)
+        return stats.to_dict()
+
 
+def _clean_record_with_keys(record: Dict[str, Any]) -> Tuple[Dict[str, Any], int, int]:
+    """Очищает запись в дочернем процессе (DataCleaner не имеет настроек)."""
+    # Запись уже является копией, полученной через pickle
+    return DataCleaner().clean_record_with_keys(record, copy=False)
@@ -4,24 +4,187 @@
 """
 
 import os
-from typing import List, Optional, Dict, Any
+import sqlite3
+import hashlib
+import importlib.util
+from array import array
+from typing import List, Optional, Dict, Any, Tuple, Iterable, Iterator
+from itertools import islice
 import time
+import random
+import asyncio
 import logging
+import threading
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
 
 # КРИТИЧНО: Отключаем Xet Storage ДО любых импортов huggingface_hub
 # Это должно быть установлено до импорта sentence_transformers
 os.environ['HF_HUB_DISABLE_XET'] = '1'
-os.environ['HF_HUB_ENABLE_XET'] = '0'
+os.environ['HF_HUB_DISABLE_XET_WARNING'] = '1'
 
 # Отключаем ONNX оптимизацию для избежания загрузки ONNX файлов через Xet Storage
 os.environ['SENTENCE_TRANSFORMERS_DISABLE_ONNX'] = '1'
 os.environ['ST_DISABLE_ONNX'] = '1'
 
+# Многопоточная загрузка файлов модели через hf_transfer (если установлен).
+# Без установленного пакета флаг приводит к ошибке в huggingface_hub
+if importlib.util.find_spec('hf_transfer') is not None:
+    os.environ.setdefault('HF_HUB_ENABLE_HF_TRANSFER', '1')
+
+# Файлы весов других фреймворков, которые SentenceTransformer не использует
+_HF_IGNORE_PATTERNS = [
+    '*.h5', '*.msgpack', '*.ot',
+    'tf_model*', 'flax_model*', 'rust_model*',
+]
+
+# Загруженные модели SentenceTransformer, общие для всех генераторов процесса:
+# (model_name, device, backend, onnx_file_name, precision, attn_implementation) -> (модель, блокировка encode)
+_MODEL_CACHE: Dict[Tuple, Tuple[Any, threading.Lock]] = {}
+_MODEL_CACHE_LOCK = threading.Lock()
+# Блокировки загрузки по ключу _MODEL_CACHE: одну модель загружает один поток
+_MODEL_LOAD_LOCKS: Dict[Tuple, threading.Lock] = {}
+
+# Потоки OpenMP/MKL читаются при импорте torch, поэтому задаем их заранее
+# (явно установленные пользователем значения не перезаписываются)
+os.environ.setdefault('OMP_NUM_THREADS', str(os.cpu_count() or 1))
+os.environ.setdefault('MKL_NUM_THREADS', str(os.cpu_count() or 1))
+
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+def _get_cached_model(cache_key: Tuple, load) -> Tuple[Tuple[Any, threading.Lock], bool]:
+    """
+    Возвращает модель из _MODEL_CACHE, загружая ее при отсутствии.
+    
+    Общая блокировка кэша держится только на время поиска, а загрузка идет
+    под блокировкой своего ключа: долгая загрузка одной модели не задерживает
+    генераторы других (в том числе уже загруженных) моделей.
+    
+    Args:
+        cache_key: Ключ модели в _MODEL_CACHE
+        load: Функция без аргументов, загружающая модель
+        
+    Returns:
+        ((модель, блокировка encode), True если модель загружена этим вызовом)
+    """
+    with _MODEL_CACHE_LOCK:
+        cached = _MODEL_CACHE.get(cache_key)
+        if cached is not None:
+            return cached, False
+        load_lock = _MODEL_LOAD_LOCKS.setdefault(cache_key, threading.Lock())
+    
+    with load_lock:
+        # Модель мог загрузить поток, который держал блокировку ключа раньше
+        with _MODEL_CACHE_LOCK:
+            cached = _MODEL_CACHE.get(cache_key)
+        if cached is not None:
+            return cached, False
+        
+        cached = (load(), threading.Lock())
+        with _MODEL_CACHE_LOCK:
+            _MODEL_CACHE[cache_key] = cached
+            _MODEL_LOAD_LOCKS.pop(cache_key, None)
+        return cached, True
+
+
+def _sentence_transformers_version() -> Tuple[int, int]:
+    """Возвращает (major, minor) установленной версии sentence-transformers."""
+    import sentence_transformers
+    
+    parts = sentence_transformers.__version__.split('.')
+    return tuple(int(''.join(ch for ch in part if ch.isdigit()) or 0) for part in parts[:2])
+
+
+class _AsyncRateLimiter:
+    """Выдерживает минимальный интервал между стартами запросов без блокировки event loop."""
+    
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._lock = asyncio.Lock()
+        self._next_start = 0.0
+    
+    async def wait(self):
+        """Ждет, пока можно будет отправить следующий запрос."""
+        if self.interval <= 0:
+            return
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            now = loop.time()
+            if self._next_start > now:
+                await asyncio.sleep(self._next_start - now)
+                now = self._next_start
+            self._next_start = now + self.interval
+
+
+def _error_status(error: Exception) -> Optional[int]:
+    """Возвращает HTTP статус из исключения aiohttp или OpenAI SDK."""
+    status = getattr(error, 'status', None)
+    if status is None:
+        status = getattr(error, 'status_code', None)
+    return status if isinstance(status, int) else None
+
+
+def _is_retryable_error(error: Exception) -> bool:
+    """
+    Проверяет, имеет ли смысл повторить запрос после ошибки.
+    
+    Args:
+        error: Исключение запроса
+        
+    Returns:
+        True для 429, 5xx, ошибок соединения и таймаутов
+    """
+    status = _error_status(error)
+    if status is not None:
+        return status == 429 or status >= 500
+    if isinstance(error, (asyncio.TimeoutError, ConnectionError)):
+        return True
+    # APIConnectionError/APITimeoutError (openai), ClientConnectionError (aiohttp)
+    return any(cls.__name__ in ('APIConnectionError', 'APITimeoutError', 'ClientConnectionError')
+               for cls in type(error).__mro__)
+
+
+def _retry_after_seconds(error: Exception) -> Optional[float]:
+    """Возвращает задержку из заголовка Retry-After ответа, если он есть."""
+    headers = getattr(error, 'headers', None)
+    if headers is None:
+        response = getattr(error, 'response', None)
+        headers = getattr(response, 'headers', None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get('retry-after') or headers.get('Retry-After'))
+    except (TypeError, ValueError):
+        return None
+
+
+def _resolve_device(device: str) -> str:
+    """
+    Выбирает устройство для 'auto': cuda, затем mps (Apple Silicon), иначе cpu.
+    
+    Args:
+        device: Устройство ('auto', 'cpu', 'cuda', 'cuda:1', 'mps', ...)
+        
+    Returns:
+        Конкретное устройство (остальные значения возвращаются без изменений)
+    """
+    if device != 'auto':
+        return device
+    try:
+        import torch
+    except ImportError:
+        return 'cpu'
+    if torch.cuda.is_available():
+        return 'cuda'
+    mps = getattr(torch.backends, 'mps', None)
+    if mps is not None and mps.is_available():
+        return 'mps'
+    return 'cpu'
+
+
 class EmbeddingGenerator:
     """Базовый класс для генерации эмбеддингов."""
     
@@ -36,16 +199,86 @@ class EmbeddingGenerator:
             Список векторов эмбеддингов
         """
         raise NotImplementedError
+    
+    def generate_array(self, texts: List[str]):
+        """
+        Генерирует эмбеддинги в виде одной матрицы numpy.
+        
+        Матрица float32 занимает в разы меньше памяти, чем список списков
+        Python float, и подходит для векторных операций (косинусная близость
+        через матричное умножение).
+        
+        Args:
+            texts: Список текстов
+            
+        Returns:
+            C-contiguous матрица float32 размера (len(texts), dimension)
+        """
+        import numpy as np
+        
+        if not texts:
+            return np.empty((0, self.get_dimension()), dtype=np.float32)
+        
+        embeddings = self.generate(texts)
+        if any(not embedding for embedding in embeddings):
+            raise ValueError("Не удалось сгенерировать эмбеддинги для части текстов")
+        dimension = len(embeddings[0])
+        if any(len(embedding) != dimension for embedding in embeddings):
+            raise ValueError("Эмбеддинги текстов имеют разную размерность")
+        
+        return np.asarray(embeddings, dtype=np.float32).reshape(len(texts), dimension)
+    
+    async def agenerate(self, texts: List[str]) -> List[List[float]]:
+        """
+        Асинхронно генерирует эмбеддинги, не блокируя event loop.
+        
+        По умолчанию выполняет generate в отдельном потоке.
+        
+        Args:
+            texts: Список текстов
+            
+        Returns:
+            Список векторов эмбеддингов
+        """
+        return await asyncio.to_thread(self.generate, texts)
+    
+    def get_dimension(self) -> int:
+        """Возвращает размерность эмбеддингов."""
+        raise NotImplementedError
+    
+    def close(self):
+        """Освобождает ресурсы генератора (потоки, соединения)."""
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+    
+    def get_model_id(self) -> str:
+        """Возвращает идентификатор модели (используется как ключ кэша эмбеддингов)."""
+        return self.__class__.__name__
 
 
 class OpenAIEmbeddingGenerator(EmbeddingGenerator):
     """Генератор эмбеддингов с использованием OpenAI API."""
     
+    # Размерности эмбеддингов моделей OpenAI
+    _DIMENSIONS = {
+        "text-embedding-3-small": 1536,
+        "text-embedding-3-large": 3072,
+        "text-embedding-ada-002": 1536,
+    }
+    
     def __init__(self, 
                  model: str = "text-embedding-3-small",
                  api_key: Optional[str] = None,
                  batch_size: int = 100,
-                 delay_between_batches: float = 0.1):
+                 delay_between_batches: float = 0.1,
+                 max_concurrency: int = 4,
+                 use_aiohttp: bool = True,
+                 max_retries: int = 5,
+                 request_timeout: float = 60.0):
         """
         Инициализация OpenAI генератора.
         
@@ -53,20 +286,30 @@ class OpenAIEmbeddingGenerator(EmbeddingGenerator):
             model: Модель OpenAI для эмбеддингов
             api_key: API ключ OpenAI (если None, берется из переменной окружения)
             batch_size: Размер батча для обработки
-            delay_between_batches: Задержка между батчами (секунды)
+            delay_between_batches: Минимальный интервал между отправкой батчей (секунды)
+            max_concurrency: Максимальное количество одновременных запросов
+            use_aiohttp: Отправлять запросы напрямую через aiohttp (если установлен),
+                минуя HTTP-клиент OpenAI SDK
+            max_retries: Количество повторов батча при временных ошибках
+                (429, 5xx, обрыв соединения, таймаут)
+            request_timeout: Таймаут одного запроса в секундах
         """
         self.model = model
         self.api_key = api_key or os.getenv('OPENAI_API_KEY')
         self.batch_size = batch_size
         self.delay_between_batches = delay_between_batches
+        self.max_concurrency = max_concurrency
+        self.use_aiohttp = use_aiohttp
+        self.max_retries = max_retries
+        self.request_timeout = request_timeout
+        self.embeddings_url = os.getenv('OPENAI_BASE_URL', 'https://api.openai.com/v1').rstrip('/') + '/embeddings'
         
         if not self.api_key:
             raise ValueError("Необходим API ключ OpenAI. Установите OPENAI_API_KEY или передайте api_key")
         
-        # Импортируем OpenAI только если используется
+        # Проверяем наличие OpenAI SDK (клиент создается в agenerate)
         try:
-            from openai import OpenAI
-            self.client = OpenAI(api_key=self.api_key)
+            from openai import AsyncOpenAI  # noqa: F401
         except ImportError:
             raise ImportError("Для использования OpenAIEmbeddingGenerator установите openai: pip install openai")
     
@@ -74,49 +317,127 @@ class OpenAIEmbeddingGenerator(EmbeddingGenerator):
         """
         Генерирует эмбеддинги через OpenAI API.
         
+        Батчи отправляются параллельно (не более max_concurrency одновременно).
+        Из асинхронного кода используйте agenerate.
+        
         Args:
             texts: Список текстов
             
         Returns:
             Список векторов эмбеддингов
         """
-        all_embeddings = []
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(self.agenerate(texts))
         
-        # Обрабатываем батчами
-        for i in range(0, len(texts), self.batch_size):
-            batch = texts[i:i + self.batch_size]
+        # Вызов из работающего event loop (Jupyter, асинхронный сервис):
+        # asyncio.run в этом потоке невозможен, запросы идут в отдельном потоке
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix='openai-embed') as executor:
+            return executor.submit(asyncio.run, self.agenerate(texts)).result()
+    
+    async def agenerate(self, texts: List[str]) -> List[List[float]]:
+        """
+        Асинхронно генерирует эмбеддинги через OpenAI API.
+        
+        Args:
+            texts: Список текстов
             
+        Returns:
+            Список векторов эмбеддингов в порядке входных текстов
+        """
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        
+        aiohttp = None
+        if self.use_aiohttp:
             try:
-                response = self.client.embeddings.create(
+                import aiohttp
+            except ImportError:
+                pass
+        
+        if aiohttp is not None:
+            # Прямой POST к эндпоинту эмбеддингов с пулом keep-alive соединений
+            connector = aiohttp.TCPConnector(
+                limit=self.max_concurrency,
+                ttl_dns_cache=300,
+                keepalive_timeout=60
+            )
+            headers = {'Authorization': f'Bearer {self.api_key}'}
+            timeout = aiohttp.ClientTimeout(total=self.request_timeout)
+            async with aiohttp.ClientSession(connector=connector, headers=headers, timeout=timeout) as session:
+                async def request(batch: List[str]) -> List[List[float]]:
+                    async with session.post(self.embeddings_url,
+                                            json={'model': self.model, 'input': batch}) as response:
+                        response.raise_for_status()
+                        payload = await response.json()
+                    data = sorted(payload['data'], key=lambda item: item['index'])
+                    return [item['embedding'] for item in data]
+                
+                return await self._run_batches(batches, request)
+        
+        from openai import AsyncOpenAI
+        
+        # Повторы выполняются в _run_batches, встроенные повторы SDK отключены
+        async with AsyncOpenAI(api_key=self.api_key, timeout=self.request_timeout, max_retries=0) as client:
+            async def request(batch: List[str]) -> List[List[float]]:
+                response = await client.embeddings.create(
                     model=self.model,
                     input=batch
                 )
-                
-                batch_embeddings = [item.embedding for item in response.data]
-                all_embeddings.extend(batch_embeddings)
-                
-                # Задержка между батчами
-                if i + self.batch_size < len(texts):
-                    time.sleep(self.delay_between_batches)
+                return [item.embedding for item in response.data]
             
-            except Exception as e:
-                print(f"[ERROR] Ошибка при генерации эмбеддингов для батча {i//self.batch_size + 1}: {e}")
-                # В случае ошибки добавляем пустые векторы
-                for _ in batch:
-                    all_embeddings.append([])
+            return await self._run_batches(batches, request)
+    
+    async def _run_batches(self, batches: List[List[str]], request) -> List[List[float]]:
+        """
+        Выполняет запросы для батчей параллельно с ограничением и паузами между стартами.
+        
+        Args:
+            batches: Список батчей текстов
+            request: Корутина, возвращающая эмбеддинги для одного батча
+            
+        Returns:
+            Список векторов эмбеддингов в порядке батчей
+        """
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        rate_limiter = _AsyncRateLimiter(self.delay_between_batches)
+        
+        async def embed_batch(batch_index: int, batch: List[str]) -> List[List[float]]:
+            async with semaphore:
+                for attempt in range(self.max_retries + 1):
+                    await rate_limiter.wait()
+                    try:
+                        return await request(batch)
+                    except Exception as e:
+                        if attempt < self.max_retries and _is_retryable_error(e):
+                            # Экспоненциальная задержка с jitter, Retry-After от сервера важнее
+                            delay = _retry_after_seconds(e)
+                            if delay is None:
+                                delay = random.uniform(0, min(30.0, 2.0 ** attempt))
+                            print(f"[WARNING] Батч {batch_index + 1}: {e}, повтор через {delay:.1f} с")
+                            await asyncio.sleep(delay)
+                            continue
+                        print(f"[ERROR] Ошибка при генерации эмбеддингов для батча {batch_index + 1}: {e}")
+                        # В случае ошибки добавляем пустые векторы
+                        return [[] for _ in batch]
+        
+        batch_results = await asyncio.gather(
+            *(embed_batch(i, batch) for i, batch in enumerate(batches))
+        )
+        
+        all_embeddings = []
+        for batch_embeddings in batch_results:
+            all_embeddings.extend(batch_embeddings)
         
         return all_embeddings
     
     def get_dimension(self) -> int:
         """Возвращает размерность эмбеддингов."""
-        # text-embedding-3-small: 1536
-        # text-embedding-3-large: 3072
-        dimension_map = {
-            "text-embedding-3-small": 1536,
-            "text-embedding-3-large": 3072,
-            "text-embedding-ada-002": 1536,
-        }
-        return dimension_map.get(self.model, 1536)
+        return self._DIMENSIONS.get(self.model, 1536)
+    
+    def get_model_id(self) -> str:
+        """Возвращает идентификатор модели."""
+        return f"openai:{self.model}"
 
 
 class SentenceTransformerEmbeddingGenerator(EmbeddingGenerator):
@@ -128,33 +449,75 @@ class SentenceTransformerEmbeddingGenerator(EmbeddingGenerator):
                  batch_size: int = 32,
                  download_timeout: int = 600,
                  max_retries: int = 3,
-                 retry_delay: float = 5.0):
+                 retry_delay: float = 5.0,
+                 show_progress_bar: Optional[bool] = None,
+                 backend: str = "torch",
+                 onnx_file_name: Optional[str] = None,
+                 precision: str = "fp32",
+                 num_threads: Optional[int] = None,
+                 normalize_embeddings: bool = False,
+                 attn_implementation: Optional[str] = None,
+                 max_tokens_per_batch: Optional[int] = None):
         """
         Инициализация Sentence Transformer генератора.
         
         Args:
             model_name: Название модели из Sentence Transformers
-            device: Устройство для вычислений (cpu/cuda)
+            device: Устройство для вычислений (cpu/cuda/mps или 'auto' -
+                cuda, если доступна, затем mps, иначе cpu)
             batch_size: Размер батча для обработки
             download_timeout: Таймаут загрузки в секундах (по умолчанию 600)
             max_retries: Максимальное количество попыток загрузки
             retry_delay: Задержка между попытками в секундах
+            show_progress_bar: Показывать прогресс-бар (None - только если батчей больше одного)
+            backend: Бэкенд инференса ('torch', 'onnx' или 'openvino').
+                'onnx'/'openvino' требуют sentence-transformers>=3.2 и
+                pip install optimum[onnxruntime] / optimum[openvino]
+            onnx_file_name: Файл ONNX модели в репозитории, например
+                'onnx/model_qint8_avx512_vnni.onnx' для int8 квантизованной версии
+            precision: Точность весов torch модели ('fp32', 'fp16', 'bf16', 'int8' или 'auto').
+                'fp16' - только на cuda/mps, 'int8' - динамическая квантизация на cpu,
+                'auto' - 'fp16' на cuda/mps и 'fp32' на cpu
+            num_threads: Количество потоков torch на cpu (None - все ядра)
+            normalize_embeddings: L2-нормализовать векторы (косинусная близость
+                сводится к скалярному произведению)
+            attn_implementation: Реализация attention в transformers ('sdpa', 'eager',
+                'flash_attention_2'; 'sdpa' на cuda задействует FlashAttention/memory-efficient
+                ядра PyTorch 2.x). Требует sentence-transformers>=3.0, на более старых
+                версиях игнорируется. None - выбор transformers по умолчанию
+            max_tokens_per_batch: Бюджет токенов на батч с учетом паддинга. Если задан,
+                тексты сортируются по числу токенов и группируются динамически:
+                длинные - меньшими батчами, короткие - большими (None - фиксированный batch_size)
         """
+        device = _resolve_device(device)
+        if precision == 'auto':
+            precision = 'fp16' if device.startswith(('cuda', 'mps')) else 'fp32'
+        
         self.model_name = model_name
         self.device = device
         self.batch_size = batch_size
         self.download_timeout = download_timeout
         self.max_retries = max_retries
         self.retry_delay = retry_delay
+        self.show_progress_bar = show_progress_bar
+        self.backend = backend
+        self.onnx_file_name = onnx_file_name
+        self.precision = precision
+        self.num_threads = num_threads
+        self.normalize_embeddings = normalize_embeddings
+        self.attn_implementation = attn_implementation
+        self.max_tokens_per_batch = max_tokens_per_batch
+        self._dimension: Optional[int] = None
+        
+        # Отдельный поток для encode в agenerate: один поток на генератор,
+        # чтобы параллельные вызовы не конкурировали за потоки torch.
+        # Создается при первом вызове agenerate и завершается в close()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_lock = threading.Lock()
         
         try:
             from sentence_transformers import SentenceTransformer
             
-            # Отключаем Xet Storage для избежания проблем с таймаутами
-            # Используем обычную HTTP загрузку через huggingface.co
-            # Правильная переменная окружения для отключения Xet Storage
-            os.environ['HF_HUB_DISABLE_XET'] = '1'
-            
             # Настройка таймаутов для Hugging Face из переменных окружения или параметров
             timeout_from_env = os.getenv('HF_HUB_DOWNLOAD_TIMEOUT')
             if timeout_from_env:
@@ -175,12 +538,73 @@ class SentenceTransformerEmbeddingGenerator(EmbeddingGenerator):
             if retry_delay_from_env:
                 self.retry_delay = float(retry_delay_from_env)
             
-            # Пытаемся загрузить модель с повторными попытками
-            self.model = self._load_model_with_retry(model_name, device)
-            print(f"[INFO] Модель загружена успешно")
+            if device == 'cpu':
+                self._configure_cpu_threads()
+            
+            # Модель с теми же параметрами уже могла быть загружена в этом процессе
+            cache_key = (model_name, device, backend, onnx_file_name, precision, self.attn_implementation)
+            def load_model():
+                # Пытаемся загрузить модель с повторными попытками
+                self.model = self._load_model_with_retry(model_name, device)
+                self._apply_precision()
+                return self.model
+            
+            cached, loaded = _get_cached_model(cache_key, load_model)
+            if loaded:
+                print(f"[INFO] Модель загружена успешно")
+            else:
+                print(f"[INFO] Используется ранее загруженная модель {model_name}")
+            # Токенизатор не допускает параллельных вызовов, поэтому encode
+            # общей модели выполняется под ее блокировкой
+            self.model, self._encode_lock = cached
         except ImportError:
             raise ImportError("Для использования SentenceTransformerEmbeddingGenerator установите: pip install sentence-transformers")
     
+    def _configure_cpu_threads(self):
+        """Задает число потоков torch для вычислений на CPU."""
+        import torch
+        
+        cpu_count = os.cpu_count() or 2
+        torch.set_num_threads(self.num_threads or cpu_count)
+        try:
+            # Можно задать только до первой параллельной операции в процессе
+            torch.set_num_interop_threads(max(1, cpu_count // 2))
+        except RuntimeError:
+            pass
+        print(f"[INFO] Потоков torch на CPU: {torch.get_num_threads()}")
+    
+    def _apply_precision(self):
+        """
+        Переводит веса модели в заданную точность.
+        
+        На GPU половинная точность вдвое снижает объем читаемых весов и
+        задействует тензорные ядра; на CPU int8 квантизация Linear слоев
+        ускоряет матричные умножения.
+        """
+        if self.precision == 'fp32' or self.backend != 'torch':
+            return
+        
+        import torch
+        
+        is_cuda = self.device.startswith('cuda')
+        if is_cuda:
+            # TF32 для оставшихся fp32 матричных умножений
+            torch.backends.cuda.matmul.allow_tf32 = True
+        
+        if self.precision == 'fp16' and (is_cuda or self.device.startswith('mps')):
+            self.model = self.model.half()
+        elif self.precision == 'bf16':
+            self.model = self.model.to(torch.bfloat16)
+        elif self.precision == 'int8' and self.device == 'cpu':
+            self.model = torch.quantization.quantize_dynamic(
+                self.model, {torch.nn.Linear}, dtype=torch.qint8
+            )
+        else:
+            print(f"[WARNING] Точность '{self.precision}' не поддерживается на устройстве {self.device}, используется fp32")
+            return
+        
+        print(f"[INFO] Модель переведена в точность {self.precision}")
+    
     def _load_model_with_retry(self, model_name: str, device: str):
         """
         Загружает модель с повторными попытками при ошибках сети.
@@ -192,43 +616,44 @@ class SentenceTransformerEmbeddingGenerator(EmbeddingGenerator):
         Returns:
             Загруженная модель SentenceTransformer
         """
-        # Убеждаемся, что Xet Storage отключен перед импортом
-        os.environ['HF_HUB_DISABLE_XET'] = '1'
-        os.environ['HF_HUB_ENABLE_XET'] = '0'
+        # Переменные окружения huggingface_hub заданы при импорте модуля и в __init__
+        os.environ['HF_HUB_DOWNLOAD_TIMEOUT'] = str(self.download_timeout)
         
-        # Дополнительные настройки для отключения Xet Storage
-        os.environ['HF_HUB_DISABLE_XET_WARNING'] = '1'
-        
-        # Отключаем ONNX оптимизацию, чтобы избежать загрузки ONNX файлов через Xet Storage
-        os.environ['SENTENCE_TRANSFORMERS_DISABLE_ONNX'] = '1'
-        os.environ['ST_DISABLE_ONNX'] = '1'
-        
-        # Пытаемся отключить Xet Storage через huggingface_hub API
         try:
             import huggingface_hub
-            # Отключаем Xet Storage через константы, если доступно
-            if hasattr(huggingface_hub, 'constants'):
-                if hasattr(huggingface_hub.constants, 'ENABLE_XET'):
-                    huggingface_hub.constants.ENABLE_XET = False
-                # Пытаемся установить через другие атрибуты
-                if hasattr(huggingface_hub.constants, 'DISABLE_XET'):
-                    huggingface_hub.constants.DISABLE_XET = True
-            
-            # Пытаемся использовать file_download с явным отключением Xet
-            if hasattr(huggingface_hub, 'file_download'):
-                # Сохраняем оригинальную функцию
-                original_file_download = huggingface_hub.file_download
-                
-                def patched_file_download(*args, **kwargs):
-                    # Принудительно отключаем Xet в параметрах
-                    kwargs['use_xet'] = False
-                    kwargs['use_xet_storage'] = False
-                    return original_file_download(*args, **kwargs)
-                
-                # Патчим функцию (но это может не сработать, так как она уже импортирована)
-                # huggingface_hub.file_download = patched_file_download
-        except (ImportError, AttributeError):
-            pass
+        except ImportError:
+            huggingface_hub = None
+        
+        # Общий кэш (например, на NFS для нескольких подов)
+        cache_dir = os.getenv('HUGGINGFACE_HUB_CACHE')
+        max_workers = int(os.getenv('HF_HUB_MAX_WORKERS', '8'))
+        
+        # Для torch бэкенда не скачиваем ONNX/OpenVINO экспорты
+        ignore_patterns = list(_HF_IGNORE_PATTERNS)
+        if self.backend == 'torch':
+            ignore_patterns += ['onnx/*', 'openvino/*']
+        
+        # Параметры SentenceTransformer
+        model_kwargs = {
+            'device': device,
+        }
+        if cache_dir:
+            model_kwargs['cache_folder'] = cache_dir
+        
+        # ONNX Runtime / OpenVINO бэкенд (если файла модели нет в репозитории,
+        # sentence-transformers экспортирует его автоматически)
+        if self.backend != 'torch':
+            model_kwargs['backend'] = self.backend
+            if self.onnx_file_name:
+                model_kwargs['model_kwargs'] = {'file_name': self.onnx_file_name}
+        elif self.attn_implementation:
+            # Передается в AutoModel.from_pretrained; параметр model_kwargs
+            # появился в sentence-transformers 3.0
+            if _sentence_transformers_version() >= (3, 0):
+                model_kwargs['model_kwargs'] = {'attn_implementation': self.attn_implementation}
+            else:
+                print(f"[WARNING] attn_implementation='{self.attn_implementation}' требует "
+                      f"sentence-transformers>=3.0, используется реализация по умолчанию")
         
         from sentence_transformers import SentenceTransformer
         
@@ -243,36 +668,22 @@ class SentenceTransformerEmbeddingGenerator(EmbeddingGenerator):
                     print("       export HF_HUB_DISABLE_XET=1")
                     print("       export HF_HUB_DOWNLOAD_TIMEOUT=1200")
                 
-                # Настройка параметров загрузки
-                # Пытаемся передать параметры для отключения Xet через cache_folder
-                model_kwargs = {
-                    'device': device,
-                }
-                
-                # Пытаемся использовать локальный кэш и принудительную загрузку через обычный HTTP
-                try:
-                    import huggingface_hub
-                    # Устанавливаем параметры для file_download через переменные окружения
-                    # Это должно заставить использовать обычный HTTP
-                    os.environ['HF_HUB_DOWNLOAD_TIMEOUT'] = str(self.download_timeout)
-                    
-                    # Пытаемся установить параметры для отключения Xet через конфигурацию
-                    # Это более надежный способ
+                # Предварительная загрузка файлов в кэш (параллельно, с докачкой)
+                if huggingface_hub is not None:
                     try:
-                        # Используем snapshot_download напрямую с явным отключением Xet
-                        # перед загрузкой через SentenceTransformer
                         print("[INFO] Предварительная загрузка модели через huggingface_hub...")
                         huggingface_hub.snapshot_download(
                             repo_id=model_name,
                             resume_download=True,
                             local_files_only=False,
+                            cache_dir=cache_dir,
+                            max_workers=max_workers,
+                            ignore_patterns=ignore_patterns,
                         )
                         print("[INFO] Модель загружена в кэш, инициализируем SentenceTransformer...")
                     except Exception as preload_error:
                         # Если предзагрузка не удалась, продолжаем обычным способом
                         logger.warning(f"Предзагрузка не удалась: {preload_error}, продолжаем обычным способом")
-                except ImportError:
-                    pass
                 
                 # Загружаем модель через SentenceTransformer
                 # Если модель уже в кэше, это должно работать быстрее
@@ -337,23 +748,239 @@ class SentenceTransformerEmbeddingGenerator(EmbeddingGenerator):
             Список векторов эмбеддингов
         """
         try:
+            # Преобразуем в список списков одним вызовом для всей матрицы
+            return self.generate_array(texts).tolist()
+        
+        except Exception as e:
+            print(f"[ERROR] Ошибка при генерации эмбеддингов: {e}")
+            return [[]] * len(texts)
+    
+    def generate_array(self, texts: List[str]):
+        """
+        Генерирует эмбеддинги в виде матрицы numpy без промежуточных списков.
+        
+        Args:
+            texts: Список текстов
+            
+        Returns:
+            C-contiguous матрица float32 размера (len(texts), dimension)
+        """
+        import numpy as np
+        
+        # Прогресс-бар для одного батча (например, эмбеддинга запроса) лишь тратит время на вывод
+        show_progress_bar = self.show_progress_bar
+        if show_progress_bar is None:
+            show_progress_bar = len(texts) > self.batch_size
+        
+        if not texts:
+            return np.empty((0, self.get_dimension()), dtype=np.float32)
+        
+        if self.max_tokens_per_batch:
+            return self._generate_token_batched(texts)
+        
+        # encode сам сортирует тексты по длине перед разбиением на батчи
+        # и возвращает результат в исходном порядке, минимизируя паддинг
+        with self._encode_lock, self._inference_context():
             embeddings = self.model.encode(
                 texts,
                 batch_size=self.batch_size,
-                show_progress_bar=True,
-                convert_to_numpy=True
+                show_progress_bar=show_progress_bar,
+                convert_to_numpy=True,
+                normalize_embeddings=self.normalize_embeddings
             )
+        
+        # Модель в fp16/bf16 возвращает векторы пониженной точности
+        return np.ascontiguousarray(embeddings, dtype=np.float32)
+    
+    def _token_batches(self, texts: List[str]) -> List[List[int]]:
+        """
+        Группирует тексты в батчи по числу токенов.
+        
+        Длины считаются быстрым (Rust) токенизатором модели одним вызовом для
+        всех текстов. Тексты сортируются по длине, и батч закрывается, когда
+        размер с паддингом (число текстов * максимальная длина) превышает бюджет.
+        
+        Args:
+            texts: Список текстов
             
-            # Преобразуем в список списков
-            return embeddings.tolist()
+        Returns:
+            Список батчей - списков индексов текстов
+        """
+        encoded = self.model.tokenizer(
+            texts,
+            padding=False,
+            truncation=True,
+            max_length=self.model.max_seq_length,
+        )
+        lengths = [len(ids) for ids in encoded['input_ids']]
+        order = sorted(range(len(texts)), key=lengths.__getitem__)
         
-        except Exception as e:
-            print(f"[ERROR] Ошибка при генерации эмбеддингов: {e}")
-            return [[]] * len(texts)
+        batches = []
+        batch: List[int] = []
+        for i in order:
+            # Сортировка по возрастанию: длина текущего текста - максимальная в батче
+            if batch and (len(batch) + 1) * lengths[i] > self.max_tokens_per_batch:
+                batches.append(batch)
+                batch = []
+            batch.append(i)
+        if batch:
+            batches.append(batch)
+        return batches
+    
+    def _inference_context(self):
+        """
+        Контекст для encode: torch.inference_mode для torch бэкенда.
+        
+        В отличие от no_grad внутри encode, inference_mode не ведет счетчики
+        версий тензоров и учет для autograd; для ONNX/OpenVINO не нужен.
+        """
+        if self.backend != 'torch':
+            return contextlib.nullcontext()
+        import torch
+        return torch.inference_mode()
+    
+    def _generate_token_batched(self, texts: List[str]):
+        """
+        Генерирует эмбеддинги батчами динамического размера по бюджету токенов.
+        
+        Args:
+            texts: Список текстов
+            
+        Returns:
+            C-contiguous матрица float32 размера (len(texts), dimension)
+        """
+        import numpy as np
+        
+        result = None
+        with self._encode_lock, self._inference_context():
+            for batch in self._token_batches(texts):
+                embeddings = self.model.encode(
+                    [texts[i] for i in batch],
+                    batch_size=len(batch),
+                    show_progress_bar=False,
+                    convert_to_numpy=True,
+                    normalize_embeddings=self.normalize_embeddings
+                )
+                if result is None:
+                    result = np.empty((len(texts), embeddings.shape[1]), dtype=np.float32)
+                result[batch] = embeddings
+        return result
+    
+    async def agenerate(self, texts: List[str]) -> List[List[float]]:
+        """
+        Асинхронно генерирует эмбеддинги в выделенном потоке модели.
+        
+        Args:
+            texts: Список текстов
+            
+        Returns:
+            Список векторов эмбеддингов
+        """
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='st-encode')
+            executor = self._executor
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, self.generate, texts)
+    
+    def close(self):
+        """Завершает поток encode, созданный agenerate (модель остается в кэше процесса)."""
+        with self._executor_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
     
     def get_dimension(self) -> int:
         """Возвращает размерность эмбеддингов."""
-        return self.model.get_sentence_embedding_dimension()
+        # Размерность модели не меняется, запрашиваем ее один раз
+        if self._dimension is None:
+            self._dimension = self.model.get_sentence_embedding_dimension()
+        return self._dimension
+    
+    def get_model_id(self) -> str:
+        """Возвращает идентификатор модели."""
+        model_id = f"st:{self.model_name}:{'norm' if self.normalize_embeddings else 'raw'}"
+        # Квантизованная или fp16 модель дает немного другие векторы, поэтому
+        # их не смешиваем в кэше с fp32 (ключи для fp32/torch не меняются)
+        if self.backend != 'torch' or self.precision != 'fp32':
+            model_id += f":{self.backend}:{self.precision}"
+        return model_id
+
+
+class DiskEmbeddingCache:
+    """
+    Кэш эмбеддингов на диске (SQLite), адресуемый по содержимому текста.
+    
+    При повторной индексации пересекающихся корпусов эмбеддинги уже
+    встречавшихся текстов берутся из кэша, а не вычисляются заново.
+    """
+    
+    def __init__(self, path: str = "embeddings_cache.sqlite"):
+        """
+        Инициализация кэша.
+        
+        Args:
+            path: Путь к файлу базы SQLite
+        """
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (hash BLOB PRIMARY KEY, emb BLOB NOT NULL)"
+        )
+        self.conn.commit()
+    
+    @staticmethod
+    def make_key(model_id: str, text: str) -> bytes:
+        """
+        Вычисляет ключ кэша для текста.
+        
+        Args:
+            model_id: Идентификатор модели
+            text: Текст
+            
+        Returns:
+            SHA1 от модели и текста
+        """
+        return hashlib.sha1(f"{model_id}\0{text}".encode('utf-8')).digest()
+    
+    def get_many(self, keys: List[bytes]) -> Dict[bytes, List[float]]:
+        """
+        Возвращает найденные в кэше эмбеддинги.
+        
+        Args:
+            keys: Ключи кэша
+            
+        Returns:
+            Словарь ключ -> эмбеддинг (только для найденных ключей)
+        """
+        found = {}
+        # SQLite ограничивает число параметров в одном запросе
+        for i in range(0, len(keys), 500):
+            batch = keys[i:i + 500]
+            placeholders = ','.join('?' * len(batch))
+            rows = self.conn.execute(
+                f"SELECT hash, emb FROM embeddings WHERE hash IN ({placeholders})", batch
+            )
+            for key, blob in rows:
+                found[key] = array('f', blob).tolist()
+        return found
+    
+    def put_many(self, items: Dict[bytes, List[float]]):
+        """
+        Сохраняет эмбеддинги в кэш (float32).
+        
+        Args:
+            items: Словарь ключ -> эмбеддинг
+        """
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO embeddings (hash, emb) VALUES (?, ?)",
+            [(key, array('f', embedding).tobytes()) for key, embedding in items.items() if embedding]
+        )
+        self.conn.commit()
+    
+    def close(self):
+        """Закрывает соединение с базой."""
+        self.conn.close()
 
 
 def create_embedding_generator(provider: str = "openai", **kwargs) -> EmbeddingGenerator:
@@ -380,23 +1007,49 @@ def create_embedding_generator(provider: str = "openai", **kwargs) -> EmbeddingG
 def add_embeddings_to_records(records: List[Dict[str, Any]],
                               embedding_generator: EmbeddingGenerator,
                               text_field: str = 'text',
-                              embedding_field: str = 'embedding') -> List[Dict[str, Any]]:
+                              embedding_field: str = 'embedding',
+                              cache: Optional[DiskEmbeddingCache] = None) -> List[Dict[str, Any]]:
     """
     Добавляет эмбеддинги к записям.
     
+    Тексты всех записей передаются генератору одним вызовом generate,
+    поэтому размер батча определяется параметром batch_size генератора.
+    
     Args:
         records: Список записей
         embedding_generator: Генератор эмбеддингов
         text_field: Поле с текстом для эмбеддинга
         embedding_field: Поле для сохранения эмбеддинга
+        cache: Дисковый кэш эмбеддингов (вычисляются только отсутствующие в нем тексты)
         
     Returns:
         Список записей с добавленными эмбеддингами
     """
     texts = [record.get(text_field, '') for record in records]
     
-    print(f"[INFO] Генерация эмбеддингов для {len(texts)} текстов...")
-    embeddings = embedding_generator.generate(texts)
+    if cache is None:
+        print(f"[INFO] Генерация эмбеддингов для {len(texts)} текстов...")
+        embeddings = embedding_generator.generate(texts)
+    else:
+        model_id = embedding_generator.get_model_id()
+        keys = [DiskEmbeddingCache.make_key(model_id, text) for text in texts]
+        cached = cache.get_many(keys)
+        
+        # Уникальные тексты, которых нет в кэше
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+        
+        hits = sum(1 for key in keys if key in cached)
+        print(f"[INFO] Эмбеддингов в кэше: {hits}/{len(texts)}, генерация для {len(missing)} текстов...")
+        if missing:
+            new_embeddings = embedding_generator.generate(list(missing.values()))
+            computed = dict(zip(missing.keys(), new_embeddings))
+            cache.put_many(computed)
+            cached.update(computed)
+        
+        embeddings = [cached[key] for key in keys]
     
     # Добавляем эмбеддинги к записям
     for record, embedding in zip(records, embeddings):
@@ -410,3 +1063,105 @@ def add_embeddings_to_records(records: List[Dict[str, Any]],
     
     return records
 
+
+
+def add_embedding_matrix_to_records(records: List[Dict[str, Any]],
+                                    embedding_generator: EmbeddingGenerator,
+                                    text_field: str = 'text',
+                                    index_field: str = 'embedding_idx') -> Tuple[List[Dict[str, Any]], Any]:
+    """
+    Генерирует эмбеддинги одной матрицей и сохраняет в записях только индекс строки.
+    
+    В отличие от add_embeddings_to_records, векторы не превращаются в списки
+    Python float внутри каждой записи: матрица float32 (N, D) занимает в разы
+    меньше памяти и может напрямую передаваться в индексы вроде
+    faiss.IndexFlatIP.add(matrix).
+    
+    Args:
+        records: Список записей
+        embedding_generator: Генератор эмбеддингов
+        text_field: Поле с текстом для эмбеддинга
+        index_field: Поле для сохранения номера строки в матрице
+        
+    Returns:
+        Кортеж (записи, матрица эмбеддингов размера (len(records), dimension))
+    """
+    texts = [record.get(text_field, '') for record in records]
+    
+    print(f"[INFO] Генерация эмбеддингов для {len(texts)} текстов...")
+    matrix = embedding_generator.generate_array(texts)
+    dimension = matrix.shape[1] if matrix.ndim == 2 else 0
+    
+    for i, record in enumerate(records):
+        record[index_field] = i
+        if 'metadata' not in record:
+            record['metadata'] = {}
+        record['metadata']['has_embedding'] = True
+        record['metadata']['embedding_dimension'] = dimension
+    
+    print(f"[INFO] Матрица эмбеддингов {matrix.shape} построена для {len(records)} записей")
+    
+    return records, matrix
+
+
+def add_embeddings_streaming(records: Iterable[Dict[str, Any]],
+                             embedding_generator: EmbeddingGenerator,
+                             out_path: str,
+                             text_field: str = 'text',
+                             chunk_size: int = 4096,
+                             dtype: str = 'float16',
+                             offset_field: str = 'embedding_offset') -> Iterator[Dict[str, Any]]:
+    """
+    Потоково добавляет эмбеддинги к записям, записывая векторы в бинарный файл.
+    
+    Записи обрабатываются порциями по chunk_size, поэтому в памяти
+    одновременно находится только одна порция текстов и эмбеддингов.
+    Векторы дописываются в out_path подряд; в записи сохраняется номер
+    строки. Готовый файл открывается без загрузки в память:
+    np.memmap(out_path, dtype=dtype, mode='r').reshape(-1, dimension).
+    
+    Args:
+        records: Итерируемый источник записей (например, генератор чтения JSONL)
+        embedding_generator: Генератор эмбеддингов
+        out_path: Путь к файлу для матрицы эмбеддингов
+        text_field: Поле с текстом для эмбеддинга
+        chunk_size: Количество записей в порции
+        dtype: Тип элементов в файле ('float16' вдвое компактнее 'float32')
+        offset_field: Поле для сохранения номера строки в файле
+        
+    Yields:
+        Записи с номером строки эмбеддинга и метаданными
+    """
+    records_iter = iter(records)
+    offset = 0
+    
+    # Запись на диск выполняется в отдельном потоке (write освобождает GIL),
+    # пока генерируются эмбеддинги следующей порции. В очереди не больше
+    # одной порции, поэтому память остается ограниченной (двойная буферизация)
+    with open(out_path, 'wb') as f, ThreadPoolExecutor(max_workers=1, thread_name_prefix='emb-writer') as writer:
+        pending_write = None
+        while True:
+            chunk = list(islice(records_iter, chunk_size))
+            if not chunk:
+                break
+            
+            matrix = embedding_generator.generate_array([record.get(text_field, '') for record in chunk])
+            data = matrix.astype(dtype, copy=False).tobytes()
+            if pending_write is not None:
+                pending_write.result()
+            pending_write = writer.submit(f.write, data)
+            dimension = matrix.shape[1]
+            
+            for record in chunk:
+                record[offset_field] = offset
+                offset += 1
+                if 'metadata' not in record:
+                    record['metadata'] = {}
+                record['metadata']['has_embedding'] = True
+                record['metadata']['embedding_dimension'] = dimension
+                yield record
+            
+            print(f"[INFO] Эмбеддинги сгенерированы для {offset} записей")
+        
+        if pending_write is not None:
+            pending_write.result()
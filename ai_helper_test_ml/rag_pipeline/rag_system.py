@@ -3,6 +3,9 @@
 Обеспечивает поиск релевантных фрагментов и генерацию ответов.
 """
 
+import asyncio
+import threading
+from collections import OrderedDict
 from typing import List, Dict, Any, Optional
 from .vector_db import VectorDB
 from .embeddings import EmbeddingGenerator
@@ -16,7 +19,8 @@ class RAGSystem:
                  embedding_generator: EmbeddingGenerator,
                  llm_provider: str = "openai",
                  llm_model: str = "gpt-3.5-turbo",
-                 llm_api_key: Optional[str] = None):
+                 llm_api_key: Optional[str] = None,
+                 query_cache_size: int = 4096):
         """
         Инициализация RAG системы.
         
@@ -26,12 +30,19 @@ class RAGSystem:
             llm_provider: Провайдер LLM ('openai' или 'anthropic')
             llm_model: Модель LLM
             llm_api_key: API ключ для LLM
+            query_cache_size: Размер LRU кэша эмбеддингов запросов (0 - без кэша)
         """
         self.vector_db = vector_db
         self.embedding_generator = embedding_generator
         self.llm_provider = llm_provider.lower()
         self.llm_model = llm_model
         
+        # LRU кэш эмбеддингов запросов: повторный вопрос не требует
+        # нового прохода модели или запроса к API
+        self.query_cache_size = query_cache_size
+        self._query_cache: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._query_cache_lock = threading.Lock()
+        
         # Инициализация LLM клиента
         if self.llm_provider == "openai":
             try:
@@ -71,9 +82,68 @@ class RAGSystem:
         Returns:
             Список релевантных фрагментов
         """
-        # Генерируем эмбеддинг для запроса
-        query_embedding = self.embedding_generator.generate([query])[0]
+        # Генерируем эмбеддинг для запроса (или берем из кэша)
+        query_embedding = self._get_cached_query_embedding(query)
+        if query_embedding is None:
+            query_embedding = self.embedding_generator.generate([query])[0]
+            self._cache_query_embedding(query, query_embedding)
+        
+        return self.search_by_embedding(query_embedding, top_k, filter_dict)
+    
+    def _get_cached_query_embedding(self, query: str) -> Optional[List[float]]:
+        """
+        Возвращает эмбеддинг запроса из кэша.
+        
+        Вектор возвращается без копирования и не должен изменяться вызывающим кодом.
+        
+        Args:
+            query: Текст запроса
+            
+        Returns:
+            Эмбеддинг или None, если запроса нет в кэше
+        """
+        with self._query_cache_lock:
+            embedding = self._query_cache.get(query)
+            if embedding is None:
+                return None
+            self._query_cache.move_to_end(query)
+        return embedding
+    
+    def _cache_query_embedding(self, query: str, embedding: List[float]):
+        """
+        Сохраняет эмбеддинг запроса в кэш, вытесняя самый старый.
         
+        Args:
+            query: Текст запроса
+            embedding: Эмбеддинг запроса
+        """
+        # Пустой вектор означает ошибку генерации - его не кэшируем
+        if self.query_cache_size <= 0 or not embedding:
+            return
+        with self._query_cache_lock:
+            self._query_cache[query] = embedding
+            self._query_cache.move_to_end(query)
+            if len(self._query_cache) > self.query_cache_size:
+                self._query_cache.popitem(last=False)
+    
+    def search_by_embedding(self,
+                            query_embedding: List[float],
+                            top_k: int = 5,
+                            filter_dict: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """
+        Ищет релевантные фрагменты по готовому эмбеддингу запроса.
+        
+        Позволяет сгенерировать эмбеддинги для нескольких запросов одним
+        батчем и не вычислять их повторно.
+        
+        Args:
+            query_embedding: Эмбеддинг запроса
+            top_k: Количество релевантных фрагментов
+            filter_dict: Фильтр по метаданным
+            
+        Returns:
+            Список релевантных фрагментов
+        """
         # Ищем в векторной БД
         results = self.vector_db.search(
             query_vector=query_embedding,
@@ -177,4 +247,148 @@ class RAGSystem:
             'relevant_chunks': chunks,
             'num_chunks': len(chunks)
         }
-
+    
+    def ask_with_embedding(self,
+                           query: str,
+                           query_embedding: List[float],
+                           top_k: int = 5,
+                           filter_dict: Optional[Dict[str, Any]] = None,
+                           system_prompt: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Полный цикл RAG с готовым эмбеддингом запроса.
+        
+        Args:
+            query: Вопрос пользователя
+            query_embedding: Эмбеддинг запроса
+            top_k: Количество релевантных фрагментов
+            filter_dict: Фильтр по метаданным
+            system_prompt: Системный промпт
+            
+        Returns:
+            Словарь с ответом и метаданными
+        """
+        # Ищем релевантные фрагменты
+        chunks = self.search_by_embedding(query_embedding, top_k, filter_dict)
+        
+        # Генерируем ответ
+        answer = self.generate_answer(query, chunks, system_prompt)
+        
+        return {
+            'query': query,
+            'answer': answer,
+            'relevant_chunks': chunks,
+            'num_chunks': len(chunks)
+        }
+    
+    async def asearch_relevant_chunks(self,
+                                      query: str,
+                                      top_k: int = 5,
+                                      filter_dict: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """
+        Асинхронно ищет релевантные фрагменты для запроса.
+        
+        Генерация эмбеддинга и поиск в БД выполняются вне event loop,
+        поэтому другие корутины не блокируются.
+        
+        Args:
+            query: Текст запроса
+            top_k: Количество релевантных фрагментов
+            filter_dict: Фильтр по метаданным
+            
+        Returns:
+            Список релевантных фрагментов
+        """
+        query_embedding = self._get_cached_query_embedding(query)
+        if query_embedding is None:
+            query_embedding = (await self.embedding_generator.agenerate([query]))[0]
+            self._cache_query_embedding(query, query_embedding)
+        
+        return await asyncio.to_thread(self.search_by_embedding, query_embedding, top_k, filter_dict)
+    
+    async def aask(self,
+                   query: str,
+                   top_k: int = 5,
+                   filter_dict: Optional[Dict[str, Any]] = None,
+                   system_prompt: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Асинхронный полный цикл RAG: поиск + генерация ответа.
+        
+        Args:
+            query: Вопрос пользователя
+            top_k: Количество релевантных фрагментов
+            filter_dict: Фильтр по метаданным
+            system_prompt: Системный промпт
+            
+        Returns:
+            Словарь с ответом и метаданными
+        """
+        # Ищем релевантные фрагменты
+        chunks = await self.asearch_relevant_chunks(query, top_k, filter_dict)
+        
+        # Генерируем ответ (вызов LLM клиента блокирующий, выполняем в потоке)
+        answer = await asyncio.to_thread(self.generate_answer, query, chunks, system_prompt)
+        
+        return {
+            'query': query,
+            'answer': answer,
+            'relevant_chunks': chunks,
+            'num_chunks': len(chunks)
+        }
+    
+    async def ask_many(self,
+                       queries: List[str],
+                       top_k: int = 5,
+                       filter_dict: Optional[Dict[str, Any]] = None,
+                       system_prompt: Optional[str] = None,
+                       max_concurrency: int = 4) -> List[Dict[str, Any]]:
+        """
+        Асинхронный полный цикл RAG для нескольких вопросов.
+        
+        Эмбеддинги всех вопросов генерируются одним батчем, а поиск в БД
+        и вызовы LLM для разных вопросов выполняются параллельно.
+        
+        Args:
+            queries: Список вопросов
+            top_k: Количество релевантных фрагментов
+            filter_dict: Фильтр по метаданным
+            system_prompt: Системный промпт
+            max_concurrency: Максимальное число одновременных запросов к LLM
+            
+        Returns:
+            Список словарей с ответами в порядке вопросов
+        """
+        # Эмбеддинги: из кэша, недостающие - одним батчем
+        query_embeddings = [self._get_cached_query_embedding(query) for query in queries]
+        missing = [i for i, embedding in enumerate(query_embeddings) if embedding is None]
+        if missing:
+            new_embeddings = await self.embedding_generator.agenerate([queries[i] for i in missing])
+            for i, embedding in zip(missing, new_embeddings):
+                query_embeddings[i] = embedding
+                self._cache_query_embedding(queries[i], embedding)
+        
+        # Поиск для всех вопросов параллельно
+        chunks_list = await asyncio.gather(*[
+            asyncio.to_thread(self.search_by_embedding, embedding, top_k, filter_dict)
+            for embedding in query_embeddings
+        ])
+        
+        # Генерация ответов с ограничением параллельных запросов к LLM
+        semaphore = asyncio.Semaphore(max(1, max_concurrency))
+        
+        async def answer(query: str, chunks: List[Dict[str, Any]]) -> str:
+            async with semaphore:
+                return await asyncio.to_thread(self.generate_answer, query, chunks, system_prompt)
+        
+        answers = await asyncio.gather(*[
+            answer(query, chunks) for query, chunks in zip(queries, chunks_list)
+        ])
+        
+        return [
+            {
+                'query': query,
+                'answer': answer_text,
+                'relevant_chunks': chunks,
+                'num_chunks': len(chunks)
+            }
+            for query, answer_text, chunks in zip(queries, answers, chunks_list)
+        ]
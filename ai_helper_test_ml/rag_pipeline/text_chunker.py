@@ -2,19 +2,36 @@
 Модуль для разбиения длинных текстов на смысловые фрагменты (чанки) для RAG.
 """
 
+import math
 import re
-from typing import List, Dict, Any, Optional
+import sys
+from types import MappingProxyType
+from typing import List, Dict, Any, Optional, Tuple, Mapping, Iterable, Iterator
 from dataclasses import dataclass
+from functools import lru_cache
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor
 
+# Регулярные выражения компилируются один раз при импорте модуля
+# Граница предложения: пробелы после точки, восклицательного или вопросительного знака
+_SENTENCE_SPLIT_RE = re.compile(r'(?<=[.!?])\s+')
+# Граница абзаца: два и более перевода строки подряд
+_PARAGRAPH_SPLIT_RE = re.compile(r'\n\n+')
 
-@dataclass
+# Общий пустой словарь для записей без метаданных (только для чтения)
+_EMPTY_METADATA: Dict[str, Any] = {}
+
+
+# slots=True (Python 3.10+) убирает __dict__ у каждого экземпляра:
+# чанков создаются миллионы, и это заметно экономит память
+@dataclass(**({'slots': True} if sys.version_info >= (3, 10) else {}))
 class Chunk:
     """Класс для представления текстового чанка."""
     text: str
     chunk_id: str
     chunk_index: int
     parent_id: Optional[str] = None
-    metadata: Optional[Dict[str, Any]] = None
+    metadata: Optional[Mapping[str, Any]] = None
 
 
 class TextChunker:
@@ -23,7 +40,8 @@ class TextChunker:
     def __init__(self, 
                  chunk_size: int = 500,
                  chunk_overlap: int = 50,
-                 min_chunk_size: int = 100):
+                 min_chunk_size: int = 100,
+                 r_max: Optional[float] = None):
         """
         Инициализация TextChunker.
         
@@ -31,10 +49,14 @@ class TextChunker:
             chunk_size: Максимальный размер чанка в символах
             chunk_overlap: Перекрытие между чанками в символах
             min_chunk_size: Минимальный размер чанка
+            r_max: Максимальная доля перекрытия от chunk_size для адаптивного
+                перекрытия: оно вычисляется по длине текста так, чтобы чанков
+                было как можно меньше (None - фиксированное chunk_overlap)
         """
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
         self.min_chunk_size = min_chunk_size
+        self.r_max = r_max
     
     def split_by_sentences(self, text: str) -> List[str]:
         """
@@ -46,10 +68,13 @@ class TextChunker:
         Returns:
             Список предложений
         """
-        # Регулярное выражение для разбиения на предложения
-        # Учитывает точки, восклицательные и вопросительные знаки
-        sentences = re.split(r'(?<=[.!?])\s+', text)
-        return [s.strip() for s in sentences if s.strip()]
+        # Учитывает точки, восклицательные и вопросительные знаки.
+        # Разделитель поглощает все пробелы между предложениями, поэтому после
+        # strip() всего текста части уже не содержат крайних пробелов и пустых строк
+        text = text.strip()
+        if not text:
+            return []
+        return _SENTENCE_SPLIT_RE.split(text)
     
     def split_by_paragraphs(self, text: str) -> List[str]:
         """
@@ -61,12 +86,11 @@ class TextChunker:
         Returns:
             Список абзацев
         """
-        paragraphs = text.split('\n\n')
-        return [p.strip() for p in paragraphs if p.strip()]
+        return [p for p in (x.strip() for x in _PARAGRAPH_SPLIT_RE.split(text)) if p]
     
     def create_chunks_from_text(self, text: str, 
                                 chunk_id_prefix: str = "chunk",
-                                parent_metadata: Optional[Dict[str, Any]] = None) -> List[Chunk]:
+                                parent_metadata: Optional[Mapping[str, Any]] = None) -> List[Chunk]:
         """
         Создает чанки из текста, разбивая по предложениям.
         
@@ -76,113 +100,40 @@ class TextChunker:
             parent_metadata: Метаданные родительской записи
             
         Returns:
-            Список чанков
+            Список чанков. Метаданные - один общий объект для всех чанков
+            текста (без копии на каждый чанк), изменять его не следует
         """
+        metadata = parent_metadata if parent_metadata else {}
+        
         # Если текст короткий, возвращаем как один чанк
         if len(text) <= self.chunk_size:
             chunk = Chunk(
                 text=text,
                 chunk_id=f"{chunk_id_prefix}_0",
                 chunk_index=0,
-                metadata=parent_metadata.copy() if parent_metadata else {}
+                metadata=metadata
             )
             return [chunk]
         
-        chunks = []
-        sentences = self.split_by_sentences(text)
-        
-        current_chunk = []
-        current_length = 0
-        chunk_index = 0
-        
-        for sentence in sentences:
-            sentence_length = len(sentence)
-            
-            # Если одно предложение больше чанка, разбиваем его
-            if sentence_length > self.chunk_size:
-                # Сначала сохраняем текущий чанк если есть
-                if current_chunk:
-                    chunk_text = ' '.join(current_chunk)
-                    chunks.append(Chunk(
-                        text=chunk_text,
-                        chunk_id=f"{chunk_id_prefix}_{chunk_index}",
-                        chunk_index=chunk_index,
-                        metadata=parent_metadata.copy() if parent_metadata else {}
-                    ))
-                    chunk_index += 1
-                    current_chunk = []
-                    current_length = 0
-                
-                # Разбиваем большое предложение по словам
-                words = sentence.split()
-                temp_chunk = []
-                temp_length = 0
-                
-                for word in words:
-                    word_length = len(word) + 1  # +1 for space
-                    
-                    if temp_length + word_length > self.chunk_size and temp_chunk:
-                        chunk_text = ' '.join(temp_chunk)
-                        chunks.append(Chunk(
-                            text=chunk_text,
-                            chunk_id=f"{chunk_id_prefix}_{chunk_index}",
-                            chunk_index=chunk_index,
-                            metadata=parent_metadata.copy() if parent_metadata else {}
-                        ))
-                        chunk_index += 1
-                        # Начинаем новый чанк с перекрытием
-                        overlap_sentences = temp_chunk[-self.chunk_overlap // 10:] if len(temp_chunk) > self.chunk_overlap // 10 else temp_chunk
-                        temp_chunk = overlap_sentences + [word]
-                        temp_length = sum(len(w) for w in temp_chunk) + len(temp_chunk) - 1
-                    else:
-                        temp_chunk.append(word)
-                        temp_length += word_length
-                
-                if temp_chunk:
-                    current_chunk = temp_chunk
-                    current_length = temp_length
-            
-            # Добавляем предложение к текущему чанку
-            elif current_length + sentence_length + 1 <= self.chunk_size:
-                current_chunk.append(sentence)
-                current_length += sentence_length + 1
-            else:
-                # Сохраняем текущий чанк
-                if current_chunk:
-                    chunk_text = ' '.join(current_chunk)
-                    if len(chunk_text) >= self.min_chunk_size:
-                        chunks.append(Chunk(
-                            text=chunk_text,
-                            chunk_id=f"{chunk_id_prefix}_{chunk_index}",
-                            chunk_index=chunk_index,
-                            metadata=parent_metadata.copy() if parent_metadata else {}
-                        ))
-                        chunk_index += 1
-                    
-                    # Начинаем новый чанк с перекрытием
-                    if self.chunk_overlap > 0 and len(current_chunk) > 1:
-                        overlap_count = max(1, len(current_chunk) // 3)
-                        current_chunk = current_chunk[-overlap_count:] + [sentence]
-                        current_length = sum(len(s) for s in current_chunk) + len(current_chunk) - 1
-                    else:
-                        current_chunk = [sentence]
-                        current_length = sentence_length
-                else:
-                    current_chunk = [sentence]
-                    current_length = sentence_length
-        
-        # Добавляем последний чанк
-        if current_chunk:
-            chunk_text = ' '.join(current_chunk)
-            if len(chunk_text) >= self.min_chunk_size:
-                chunks.append(Chunk(
-                    text=chunk_text,
-                    chunk_id=f"{chunk_id_prefix}_{chunk_index}",
-                    chunk_index=chunk_index,
-                    metadata=parent_metadata.copy() if parent_metadata else {}
-                ))
-        
-        return chunks
+        if self.r_max is not None:
+            texts = _split_into_chunk_texts(
+                text, self.chunk_size,
+                _adaptive_overlap(len(text), self.chunk_size, self.r_max),
+                self.min_chunk_size, overlap_by_length=True
+            )
+        else:
+            texts = _split_into_chunk_texts(text, self.chunk_size, self.chunk_overlap,
+                                            self.min_chunk_size)
+        id_prefix = chunk_id_prefix + '_'
+        return [
+            Chunk(
+                text=chunk_text,
+                chunk_id=id_prefix + str(chunk_index),
+                chunk_index=chunk_index,
+                metadata=metadata
+            )
+            for chunk_index, chunk_text in enumerate(texts)
+        ]
     
     def chunk_record(self, record: Dict[str, Any], 
                     chunk_text_field: str = 'text',
@@ -205,15 +156,22 @@ class TextChunker:
         if not enable_chunking or len(text) <= self.chunk_size:
             return [record]
         
-        # Создаем чанки
-        parent_metadata = {
+        # Поля родительской записи читаем один раз для всех чанков
+        question = record.get('question', '')
+        answer = record.get('answer', '')
+        category = record.get('category', '')
+        section = record.get('section', '')
+        
+        # Создаем чанки; метаданные общие для всех чанков записи и доступны
+        # только для чтения (MappingProxyType), поэтому копировать их не нужно
+        parent_metadata = MappingProxyType({
             'parent_id': record_id,
-            'original_question': record.get('question', ''),
-            'original_answer': record.get('answer', ''),
-            'category': record.get('category', ''),
-            'section': record.get('section', ''),
-            'source': record.get('metadata', {}).get('source', ''),
-        }
+            'original_question': question,
+            'original_answer': answer,
+            'category': category,
+            'section': section,
+            'source': (record.get('metadata') or _EMPTY_METADATA).get('source', ''),
+        })
         
         chunks = self.create_chunks_from_text(
             text,
@@ -222,15 +180,14 @@ class TextChunker:
         )
         
         # Преобразуем чанки в формат записей
-        chunk_records = []
-        for chunk in chunks:
-            chunk_record = {
+        return [
+            {
                 'id': chunk.chunk_id,
                 'parent_id': record_id,
-                'question': record.get('question', ''),
-                'answer': record.get('answer', ''),
-                'category': record.get('category', ''),
-                'section': record.get('section', ''),
+                'question': question,
+                'answer': answer,
+                'category': category,
+                'section': section,
                 'text': chunk.text,
                 'chunk_index': chunk.chunk_index,
                 'is_chunk': True,
@@ -240,13 +197,64 @@ class TextChunker:
                     'is_chunk': True,
                 }
             }
-            chunk_records.append(chunk_record)
+            for chunk in chunks
+        ]
+    
+    def iter_chunks(self, records: Iterable[Dict[str, Any]],
+                    enable_chunking: bool = True,
+                    min_text_length: int = 500) -> Iterator[Dict[str, Any]]:
+        """
+        Лениво разбивает записи на чанки (генератор).
+        
+        В отличие от chunk_records, результат не собирается в список:
+        чанки можно сразу передавать дальше (например, в генерацию
+        эмбеддингов порциями), не держа в памяти все чанки корпуса.
         
-        return chunk_records
+        Args:
+            records: Итерируемый источник записей
+            enable_chunking: Включить ли разбиение на чанки
+            min_text_length: Минимальная длина текста для разбиения на чанки
+            
+        Yields:
+            Записи (исходные короткие записи и чанки) в исходном порядке
+        """
+        yield from self._iter_chunks(records, enable_chunking, min_text_length)
+    
+    def _iter_chunks(self, records: Iterable[Dict[str, Any]],
+                     enable_chunking: bool,
+                     min_text_length: int,
+                     long_record_chunks: Optional[Iterator[List[Dict[str, Any]]]] = None
+                     ) -> Iterator[Dict[str, Any]]:
+        """
+        Разбивает записи на чанки (общая часть iter_chunks и chunk_records).
+        
+        Args:
+            records: Итерируемый источник записей
+            enable_chunking: Включить ли разбиение на чанки
+            min_text_length: Минимальная длина текста для разбиения на чанки
+            long_record_chunks: Готовые чанки длинных записей в порядке их
+                следования (из пула процессов); None - разбивать здесь
+            
+        Yields:
+            Записи (исходные короткие записи и чанки) в исходном порядке
+        """
+        for record in records:
+            # Разбиваем только длинные тексты
+            if enable_chunking and len(record.get('text', '')) > min_text_length:
+                if long_record_chunks is not None:
+                    yield from next(long_record_chunks)
+                else:
+                    yield from self.chunk_record(record, enable_chunking=True)
+            else:
+                # Короткие записи оставляем как есть
+                record['is_chunk'] = False
+                record.setdefault('metadata', {})['is_chunk'] = False
+                yield record
     
     def chunk_records(self, records: List[Dict[str, Any]],
                      enable_chunking: bool = True,
-                     min_text_length: int = 500) -> List[Dict[str, Any]]:
+                     min_text_length: int = 500,
+                     num_workers: int = 1) -> List[Dict[str, Any]]:
         """
         Разбивает список записей на чанки.
         
@@ -254,32 +262,180 @@ class TextChunker:
             records: Список записей
             enable_chunking: Включить ли разбиение на чанки
             min_text_length: Минимальная длина текста для разбиения на чанки
+            num_workers: Количество процессов для разбиения длинных записей (1 - без пула)
             
         Returns:
             Список записей (исходные + чанки)
         """
-        chunked_records = []
-        total_chunks = 0
+        executor = None
+        parallel_chunks = None
+        if num_workers > 1 and enable_chunking:
+            # В процессы передаются только длинные записи; результаты
+            # возвращаются в том же порядке, в котором они встретятся ниже
+            long_records = [record for record in records
+                            if len(record.get('text', '')) > min_text_length]
+            if long_records:
+                config = (self.chunk_size, self.chunk_overlap, self.min_chunk_size,
+                          self.r_max)
+                executor = ProcessPoolExecutor(max_workers=num_workers)
+                parallel_chunks = executor.map(_chunk_record_worker, long_records,
+                                               repeat(config), chunksize=64)
         
-        for record in records:
-            text = record.get('text', '')
-            
-            # Разбиваем только длинные тексты
-            if enable_chunking and len(text) > min_text_length:
-                chunks = self.chunk_record(record, enable_chunking=True)
-                chunked_records.extend(chunks)
-                total_chunks += len(chunks) - 1  # -1 потому что один был исходной записью
-            else:
-                # Короткие записи оставляем как есть
-                record['is_chunk'] = False
-                if 'metadata' not in record:
-                    record['metadata'] = {}
-                record['metadata']['is_chunk'] = False
-                chunked_records.append(record)
+        try:
+            chunked_records = list(self._iter_chunks(records, enable_chunking,
+                                                     min_text_length, parallel_chunks))
+        finally:
+            if executor is not None:
+                executor.shutdown()
         
+        # Каждая запись дает себя или свои чанки, поэтому новых записей
+        # столько, на сколько вырос список
+        total_chunks = len(chunked_records) - len(records)
         if enable_chunking and total_chunks > 0:
             print(f"[INFO] Создано чанков: {total_chunks}")
             print(f"[INFO] Всего записей после чанкинга: {len(chunked_records)}")
         
         return chunked_records
 
+
+def _chunk_record_worker(record: Dict[str, Any],
+                         config: Tuple[int, int, int, Optional[float]]) -> List[Dict[str, Any]]:
+    """Разбивает запись на чанки в дочернем процессе (config - параметры TextChunker)."""
+    return TextChunker(*config).chunk_record(record, enable_chunking=True)
+
+
+def _adaptive_overlap(text_length: int, chunk_size: int, r_max: float) -> int:
+    """
+    Вычисляет перекрытие, при котором текст покрывается минимальным числом чанков.
+    
+    n + 1 чанков (n = text_length // chunk_size) покрывают текст при перекрытии
+    не больше ((n + 1) * chunk_size - text_length) / n: этот запас отдается
+    под перекрытие, но не больше r_max * chunk_size.
+    
+    Args:
+        text_length: Длина текста в символах
+        chunk_size: Максимальный размер чанка
+        r_max: Максимальная доля перекрытия от chunk_size
+        
+    Returns:
+        Перекрытие в символах
+    """
+    n = text_length // chunk_size
+    if n == 0:
+        return 0
+    return min(((n + 1) * chunk_size - text_length) // n, math.floor(r_max * chunk_size))
+
+
+# Разбиение на предложения не зависит от параметров чанкера: при разбиении
+# одного текста с разными chunk_size/chunk_overlap (подбор настроек, демо)
+# регулярное выражение применяется к нему один раз
+@lru_cache(maxsize=1024)
+def _split_sentence_units(text: str) -> Tuple[str, ...]:
+    """Разбивает текст на предложения (как TextChunker.split_by_sentences)."""
+    text = text.strip()
+    return tuple(_SENTENCE_SPLIT_RE.split(text)) if text else ()
+
+
+# Разбиение текста зависит только от самого текста и параметров чанкера,
+# поэтому результат кэшируется: повторяющиеся тексты (шаблонные ответы,
+# дубликаты в корпусе) разбиваются один раз
+@lru_cache(maxsize=4096)
+def _split_into_chunk_texts(text: str, chunk_size: int, chunk_overlap: int,
+                            min_chunk_size: int,
+                            overlap_by_length: bool = False) -> Tuple[str, ...]:
+    """
+    Разбивает длинный текст на тексты чанков (по порядку chunk_index).
+    
+    При overlap_by_length в следующий чанк переносятся последние предложения
+    суммарной длиной не больше chunk_overlap символов (иначе - треть предложений).
+    """
+    chunks = []
+    append = chunks.append
+    # Упаковка в чанки - единственный шаг, зависящий от размеров
+    sentences = _split_sentence_units(text)
+    
+    # Перекрытие при разбиении длинного предложения по словам (~10 символов на слово)
+    word_overlap = max(1, chunk_overlap // 10) if chunk_overlap > 0 else 0
+    
+    current_chunk = []
+    current_length = 0
+    
+    for sentence in sentences:
+        sentence_length = len(sentence)
+        
+        # Если одно предложение больше чанка, разбиваем его
+        if sentence_length > chunk_size:
+            # Сначала сохраняем текущий чанк если есть
+            if current_chunk:
+                append(' '.join(current_chunk))
+                current_chunk = []
+                current_length = 0
+            
+            # Разбиваем большое предложение по словам
+            words = sentence.split()
+            temp_chunk = []
+            temp_length = 0
+            
+            for word in words:
+                word_length = len(word) + 1  # +1 for space
+                
+                if temp_length + word_length > chunk_size and temp_chunk:
+                    append(' '.join(temp_chunk))
+                    # Начинаем новый чанк с перекрытием
+                    # Хотя бы одно слово не переносится: иначе новый чанк начинался бы
+                    # со всего предыдущего и рос на каждом слове (квадратичная сложность)
+                    keep = min(word_overlap, len(temp_chunk) - 1)
+                    overlap_sentences = temp_chunk[-keep:] if keep > 0 else []
+                    # Длина считается только по словам перекрытия и новому слову
+                    temp_length = sum(map(len, overlap_sentences)) + len(overlap_sentences) + len(word)
+                    temp_chunk = overlap_sentences + [word]
+                else:
+                    temp_chunk.append(word)
+                    temp_length += word_length
+            
+            if temp_chunk:
+                current_chunk = temp_chunk
+                current_length = temp_length
+        
+        # Добавляем предложение к текущему чанку
+        elif current_length + sentence_length + 1 <= chunk_size:
+            current_chunk.append(sentence)
+            current_length += sentence_length + 1
+        else:
+            # Сохраняем текущий чанк
+            if current_chunk:
+                chunk_text = ' '.join(current_chunk)
+                if len(chunk_text) >= min_chunk_size:
+                    append(chunk_text)
+                
+                # Начинаем новый чанк с перекрытием
+                if overlap_by_length:
+                    overlap_count = 0
+                    overlap_length = 0
+                    for previous in reversed(current_chunk[1:]):
+                        overlap_length += len(previous) + 1
+                        if overlap_length > chunk_overlap:
+                            break
+                        overlap_count += 1
+                else:
+                    overlap_count = max(1, len(current_chunk) // 3)
+                
+                if chunk_overlap > 0 and len(current_chunk) > 1 and overlap_count:
+                    overlap = current_chunk[-overlap_count:]
+                    # Длина считается только по предложениям перекрытия и новому предложению
+                    current_length = sum(map(len, overlap)) + len(overlap) + sentence_length
+                    current_chunk = overlap + [sentence]
+                else:
+                    current_chunk = [sentence]
+                    current_length = sentence_length
+            else:
+                current_chunk = [sentence]
+                current_length = sentence_length
+    
+    # Добавляем последний чанк
+    if current_chunk:
+        chunk_text = ' '.join(current_chunk)
+        if len(chunk_text) >= min_chunk_size:
+            append(chunk_text)
+    
+    return tuple(chunks)
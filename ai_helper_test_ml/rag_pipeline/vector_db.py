@@ -3,8 +3,64 @@
 Поддерживает Pinecone, Qdrant и PostgreSQL с pgvector.
 """
 
+import hashlib
 from typing import List, Dict, Any, Optional
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from itertools import islice
+
+
+# Типы значений метаданных, которые принимают векторные БД
+_METADATA_VALUE_TYPES = (str, int, float, bool)
+
+
+def _qdrant_point_id(record_id: str) -> int:
+    """
+    Преобразует ID записи в числовой ID точки Qdrant.
+    
+    Нечисловые ID хэшируются blake2b: в отличие от встроенного hash(),
+    результат не зависит от запуска процесса (PYTHONHASHSEED), поэтому
+    повторная загрузка обновляет те же точки, а не создает дубликаты.
+    
+    Args:
+        record_id: ID записи
+        
+    Returns:
+        Неотрицательный 63-битный ID
+    """
+    if record_id.isdigit():
+        return int(record_id)
+    digest = hashlib.blake2b(record_id.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') >> 1
+
+
+def _record_metadata(record: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Формирует метаданные записи для векторной БД (без эмбеддинга).
+    
+    Args:
+        record: Запись
+        
+    Returns:
+        Словарь с основными полями и простыми значениями из record['metadata']
+    """
+    get = record.get
+    metadata = {
+        'text': get('text', ''),
+        'question': get('question', ''),
+        'answer': get('answer', ''),
+        'category': get('category', ''),
+        'section': get('section', ''),
+    }
+    
+    # Добавляем дополнительные метаданные (одно обращение к record вместо двух)
+    extra = get('metadata')
+    if extra:
+        for k, v in extra.items():
+            if isinstance(v, _METADATA_VALUE_TYPES):
+                metadata[k] = v
+    
+    return metadata
 
 
 class VectorDB(ABC):
@@ -53,7 +109,9 @@ class PineconeVectorDB(VectorDB):
     def upsert(self, records: List[Dict[str, Any]], 
                embedding_field: str = 'embedding',
                id_field: str = 'id',
-               batch_size: int = 100) -> bool:
+               batch_size: int = 100,
+               max_workers: int = 8,
+               ids_are_str: bool = False) -> bool:
         """
         Загружает записи в Pinecone.
         
@@ -62,46 +120,36 @@ class PineconeVectorDB(VectorDB):
             embedding_field: Поле с эмбеддингом
             id_field: Поле с ID
             batch_size: Размер батча для загрузки
+            max_workers: Количество батчей, загружаемых одновременно
+            ids_are_str: ID записей уже строки (например, от TextChunker) - без str()
             
         Returns:
             True если успешно
         """
         try:
-            vectors_to_upsert = []
-            
-            for record in records:
-                record_id = str(record.get(id_field, ''))
-                embedding = record.get(embedding_field, [])
-                
-                if not embedding:
-                    continue
-                
-                # Метаданные для Pinecone (без эмбеддинга)
-                metadata = {
-                    'text': record.get('text', ''),
-                    'question': record.get('question', ''),
-                    'answer': record.get('answer', ''),
-                    'category': record.get('category', ''),
-                    'section': record.get('section', ''),
-                }
-                
-                # Добавляем дополнительные метаданные
-                if 'metadata' in record:
-                    for k, v in record['metadata'].items():
-                        if isinstance(v, (str, int, float, bool)):
-                            metadata[k] = v
-                
-                vectors_to_upsert.append({
-                    'id': record_id,
+            # Список строится одним выражением, записи без эмбеддинга пропускаются
+            vectors_to_upsert = [
+                {
+                    'id': record.get(id_field, '') if ids_are_str else str(record.get(id_field, '')),
                     'values': embedding,
-                    'metadata': metadata
-                })
+                    'metadata': _record_metadata(record)
+                }
+                for record in records
+                if (embedding := record.get(embedding_field))
+            ]
             
-            # Загружаем батчами
-            for i in range(0, len(vectors_to_upsert), batch_size):
-                batch = vectors_to_upsert[i:i + batch_size]
-                self.index.upsert(vectors=batch)
-                print(f"[INFO] Загружено {min(i + batch_size, len(vectors_to_upsert))}/{len(vectors_to_upsert)} записей")
+            # Загружаем батчами параллельно: время уходит на сетевые запросы,
+            # поэтому несколько одновременных запросов скрывают задержку
+            batches = [vectors_to_upsert[i:i + batch_size]
+                       for i in range(0, len(vectors_to_upsert), batch_size)]
+            uploaded = 0
+            with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+                futures = {executor.submit(self.index.upsert, vectors=batch): len(batch)
+                           for batch in batches}
+                for future in as_completed(futures):
+                    future.result()
+                    uploaded += futures[future]
+                    print(f"[INFO] Загружено {uploaded}/{len(vectors_to_upsert)} записей")
             
             print(f"[SUCCESS] Всего загружено {len(vectors_to_upsert)} записей в Pinecone")
             return True
@@ -158,7 +206,8 @@ class PineconeVectorDB(VectorDB):
 class QdrantVectorDB(VectorDB):
     """Реализация для Qdrant."""
     
-    def __init__(self, url: str, collection_name: str, api_key: Optional[str] = None):
+    def __init__(self, url: str, collection_name: str, api_key: Optional[str] = None,
+                 prefer_grpc: bool = False):
         """
         Инициализация Qdrant клиента.
         
@@ -166,12 +215,14 @@ class QdrantVectorDB(VectorDB):
             url: URL Qdrant сервера
             collection_name: Название коллекции
             api_key: API ключ (если требуется)
+            prefer_grpc: Использовать gRPC (порт 6334) вместо REST - быстрее
+                для больших пакетных загрузок
         """
         try:
             from qdrant_client import QdrantClient
             from qdrant_client.models import Distance, VectorParams
             
-            self.client = QdrantClient(url=url, api_key=api_key)
+            self.client = QdrantClient(url=url, api_key=api_key, prefer_grpc=prefer_grpc)
             self.collection_name = collection_name
             
             # Проверяем существование коллекции
@@ -188,15 +239,22 @@ class QdrantVectorDB(VectorDB):
     def upsert(self, records: List[Dict[str, Any]],
                embedding_field: str = 'embedding',
                id_field: str = 'id',
-               vector_size: Optional[int] = None) -> bool:
+               vector_size: Optional[int] = None,
+               batch_size: int = 256) -> bool:
         """
         Загружает записи в Qdrant.
         
+        Точки формируются и отправляются батчами, поэтому в памяти находится
+        только текущий батч. Промежуточные батчи отправляются без ожидания
+        индексации (wait=False), последний - с ожиданием: обновления
+        применяются по порядку, так что после возврата загружены все точки.
+        
         Args:
             records: Список записей
             embedding_field: Поле с эмбеддингом
             id_field: Поле с ID
             vector_size: Размер вектора (определится автоматически если None)
+            batch_size: Количество точек в одном запросе
             
         Returns:
             True если успешно
@@ -204,52 +262,32 @@ class QdrantVectorDB(VectorDB):
         try:
             from qdrant_client.models import PointStruct
             
-            points = []
-            
-            for record in records:
-                record_id = record.get(id_field, '')
-                embedding = record.get(embedding_field, [])
-                
-                if not embedding:
-                    continue
-                
-                # Определяем размер вектора
-                if vector_size is None:
-                    vector_size = len(embedding)
-                
-                # Payload (метаданные)
-                payload = {
-                    'text': record.get('text', ''),
-                    'question': record.get('question', ''),
-                    'answer': record.get('answer', ''),
-                    'category': record.get('category', ''),
-                    'section': record.get('section', ''),
-                }
-                
-                # Добавляем дополнительные метаданные
-                if 'metadata' in record:
-                    for k, v in record['metadata'].items():
-                        if isinstance(v, (str, int, float, bool)):
-                            payload[k] = v
-                
-                # Qdrant требует числовой ID или строку
-                point_id = int(record_id) if record_id.isdigit() else hash(record_id) % (2**63)
-                
-                points.append(
-                    PointStruct(
-                        id=point_id,
-                        vector=embedding,
-                        payload=payload
-                    )
+            # Точки строятся лениво, записи без эмбеддинга пропускаются
+            points = (
+                PointStruct(
+                    id=_qdrant_point_id(record.get(id_field, '')),
+                    vector=embedding,
+                    payload=_record_metadata(record)
                 )
-            
-            # Загружаем точки
-            self.client.upsert(
-                collection_name=self.collection_name,
-                points=points
+                for record in records
+                if (embedding := record.get(embedding_field))
             )
             
-            print(f"[SUCCESS] Загружено {len(points)} записей в Qdrant")
+            # Загружаем точки батчами; батч отправляется, когда собран следующий,
+            # чтобы знать, какой из них последний
+            uploaded = 0
+            batch = list(islice(points, batch_size))
+            while batch:
+                next_batch = list(islice(points, batch_size))
+                self.client.upsert(
+                    collection_name=self.collection_name,
+                    points=batch,
+                    wait=not next_batch
+                )
+                uploaded += len(batch)
+                batch = next_batch
+            
+            print(f"[SUCCESS] Загружено {uploaded} записей в Qdrant")
             return True
         
         except Exception as e:
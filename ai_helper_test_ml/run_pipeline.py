@@ -7,11 +7,15 @@ import sys
 from pathlib import Path
 
 # Устанавливаем переменные окружения ДО импорта любых модулей
-os.environ['HF_HUB_DISABLE_XET'] = '1'
-os.environ['HF_HUB_ENABLE_XET'] = '0'
-os.environ['SENTENCE_TRANSFORMERS_DISABLE_ONNX'] = '1'
-os.environ['ST_DISABLE_ONNX'] = '1'
-os.environ['HF_HUB_DOWNLOAD_TIMEOUT'] = '1200'
+os.environ.update({
+    'HF_HUB_DISABLE_XET': '1',
+    'SENTENCE_TRANSFORMERS_DISABLE_ONNX': '1',
+    'ST_DISABLE_ONNX': '1',
+    'HF_HUB_DOWNLOAD_TIMEOUT': '1200',
+})
+# Многопоточная токенизация в модели эмбеддингов (tokenizers отключает ее,
+# если процесс уже делал fork; пайплайн запускается в одном процессе)
+os.environ.setdefault('TOKENIZERS_PARALLELISM', 'true')
 
 # Добавляем текущую директорию в путь
 script_dir = Path(__file__).parent
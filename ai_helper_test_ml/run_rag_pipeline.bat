@@ -5,7 +5,6 @@ echo [INFO] Настройка переменных окружения для о
 
 REM Отключаем Xet Storage
 set HF_HUB_DISABLE_XET=1
-set HF_HUB_ENABLE_XET=0
 set HF_HUB_DISABLE_XET_WARNING=1
 
 REM Отключаем ONNX оптимизацию
@@ -5,117 +5,171 @@
 
 import json
 import re
+import importlib.util
 import argparse
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import List, Dict, Any
 import pandas as pd
 
+try:
+    import orjson  # Быстрая сериализация JSON (опционально)
+except ImportError:
+    orjson = None
 
-def parse_markdown_tables(markdown_content: str) -> List[Dict[str, Any]]:
+# Буфер записи JSONL: строки сбрасываются на диск крупными блоками
+_WRITE_BUFFER_SIZE = 1024 * 1024
+
+
+# Блок Markdown: либо заголовок раздела (##), либо таблица целиком —
+# строка заголовка с ID, необязательный разделитель (|---|) и все идущие подряд
+# строки, начинающиеся с |. Пустая или любая другая строка завершает таблицу.
+_BLOCK_RE = re.compile(
+    r'^[^\S\n]*(?:(##[^\n]*)'
+    r'|\|[^\n]*ID[^\n]*(?:\n[^\n]*---[^\n]*)?((?:\n[^\S\n]*\|[^\n]*)*))',
+    re.M,
+)
+# Номера групп _BLOCK_RE, по которым выбирается обработчик (match.lastindex)
+_SECTION, _TABLE = 1, 2
+
+# Строковые колонки храним в Arrow-буферах, если установлен pyarrow;
+# иначе остается обычный object dtype
+_STRING_DTYPE = "string[pyarrow]" if importlib.util.find_spec("pyarrow") else None
+
+_DEFAULT_SECTION = "Неизвестный раздел"
+_SOURCE_NAME = "test_asks.md"
+
+
+def parse_markdown_columns(markdown_content: str) -> Dict[str, List[str]]:
     """
-    Парсит Markdown файл и извлекает данные из таблиц.
+    Парсит Markdown файл и извлекает данные из таблиц в колоночном виде.
+    
+    Таблицы и заголовки разделов находятся одним проходом предкомпилированного
+    регулярного выражения, построчно разбираются только строки самих таблиц.
+    Значения складываются в параллельные списки (по одному на поле), что
+    позволяет сразу строить из них DataFrame без промежуточных словарей.
     
     Args:
         markdown_content: Содержимое Markdown файла
         
     Returns:
-        Список словарей с извлеченными данными
+        Словарь {поле: список значений} с полями id, question, category,
+        answer, section
     """
-    chunks = []
-    lines = markdown_content.split('\n')
-    
-    current_section = None
-    i = 0
+    ids = []
+    questions = []
+    categories = []
+    answers = []
+    sections = []
+    section = _DEFAULT_SECTION
     
-    while i < len(lines):
-        line = lines[i].strip()
-        
-        # Определяем заголовок раздела (##)
-        if line.startswith('##'):
-            current_section = line.replace('##', '').strip()
-            i += 1
+    for match in _BLOCK_RE.finditer(markdown_content):
+        if match.lastindex == _SECTION:
+            # Заголовок раздела (##)
+            section = match.group(_SECTION).strip().replace('##', '').strip() or _DEFAULT_SECTION
             continue
         
-        # Пропускаем пустые строки
-        if not line:
-            i += 1
+        rows = match.group(_TABLE)
+        if not rows:
             continue
         
-        # Ищем начало таблицы (строка с | ID |)
-        if line.startswith('|') and 'ID' in line:
-            # Пропускаем разделитель таблицы (|---|---|)
-            i += 1
-            if i < len(lines) and '---' in lines[i]:
-                i += 1
+        # Группа строк таблицы начинается с перевода строки
+        for table_line in rows[1:].split('\n'):
+            # Разделители (|---|) пропускаем; пустые строки (|) отсеются по числу ячеек
+            if '---' in table_line:
+                continue
+            
+            # Парсим строку таблицы: обрезанные непустые ячейки
+            parts = list(filter(None, map(str.strip, table_line.split('|'))))
+            if len(parts) < 4:
+                continue
             
-            # Читаем строки таблицы
-            while i < len(lines):
-                table_line = lines[i].strip()
-                
-                # Если строка не начинается с |, значит таблица закончилась
-                if not table_line.startswith('|'):
-                    break
-                
-                # Пропускаем пустые строки таблицы
-                if not table_line or table_line == '|' or '---' in table_line:
-                    i += 1
-                    continue
-                
-                # Парсим строку таблицы
-                parts = [p.strip() for p in table_line.split('|') if p.strip()]
-                
-                if len(parts) >= 4:
-                    try:
-                        record_id = parts[0]
-                        question = parts[1]
-                        category = parts[2]
-                        answer = parts[3]
-                        
-                        # Создаем структурированную запись
-                        chunk = {
-                            "id": record_id,
-                            "question": question,
-                            "category": category,
-                            "answer": answer,
-                            "section": current_section or "Неизвестный раздел",
-                            "text": f"Вопрос: {question}\nОтвет: {answer}",  # Текст для эмбеддинга
-                            "metadata": {
-                                "section": current_section or "Неизвестный раздел",
-                                "category": category,
-                                "source": "test_asks.md"
-                            }
-                        }
-                        chunks.append(chunk)
-                    except (ValueError, IndexError) as e:
-                        print(f"Ошибка при парсинге строки: {table_line}, ошибка: {e}")
-                
-                i += 1
-        else:
-            i += 1
-    
-    return chunks
+            ids.append(parts[0])
+            questions.append(parts[1])
+            categories.append(parts[2])
+            answers.append(parts[3])
+            sections.append(section)
+    
+    return {
+        "id": ids,
+        "question": questions,
+        "category": categories,
+        "answer": answers,
+        "section": sections,
+    }
+
+
+def parse_markdown_tables(markdown_content: str) -> List[Dict[str, Any]]:
+    """
+    Парсит Markdown файл и извлекает данные из таблиц.
+    
+    Args:
+        markdown_content: Содержимое Markdown файла
+        
+    Returns:
+        Список словарей с извлеченными данными
+    """
+    columns = parse_markdown_columns(markdown_content)
+    
+    # Создаем структурированные записи
+    return [
+        {
+            "id": record_id,
+            "question": question,
+            "category": category,
+            "answer": answer,
+            "section": section,
+            "text": f"Вопрос: {question}\nОтвет: {answer}",  # Текст для эмбеддинга
+            "metadata": {
+                "section": section,
+                "category": category,
+                "source": _SOURCE_NAME
+            }
+        }
+        for record_id, question, category, answer, section in zip(
+            columns["id"], columns["question"], columns["category"],
+            columns["answer"], columns["section"]
+        )
+    ]
 
 
 def save_to_json(chunks: List[Dict[str, Any]], output_file: str):
     """Сохраняет данные в JSON файл."""
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(chunks, f, ensure_ascii=False, indent=2)
+    if orjson is not None:
+        with open(output_file, 'wb') as f:
+            f.write(orjson.dumps(chunks, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY))
+    else:
+        with open(output_file, 'w', encoding='utf-8') as f:
+            json.dump(chunks, f, ensure_ascii=False, indent=2)
     print(f"[OK] Сохранено {len(chunks)} записей в {output_file}")
 
 
 def save_to_jsonl(chunks: List[Dict[str, Any]], output_file: str):
     """Сохраняет данные в JSONL файл (каждая строка - отдельный JSON объект)."""
-    with open(output_file, 'w', encoding='utf-8') as f:
-        for chunk in chunks:
-            f.write(json.dumps(chunk, ensure_ascii=False) + '\n')
+    if orjson is not None:
+        option = orjson.OPT_APPEND_NEWLINE | orjson.OPT_SERIALIZE_NUMPY
+        with open(output_file, 'wb', buffering=_WRITE_BUFFER_SIZE) as f:
+            f.writelines(orjson.dumps(chunk, option=option) for chunk in chunks)
+    else:
+        with open(output_file, 'w', encoding='utf-8', buffering=_WRITE_BUFFER_SIZE) as f:
+            f.writelines(json.dumps(chunk, ensure_ascii=False) + '\n' for chunk in chunks)
     print(f"[OK] Сохранено {len(chunks)} записей в {output_file}")
 
 
-def save_to_csv(chunks: List[Dict[str, Any]], output_file: str):
-    """Сохраняет данные в CSV файл."""
-    df = pd.DataFrame(chunks)
-    df.to_csv(output_file, index=False, encoding='utf-8-sig')
-    print(f"[OK] Сохранено {len(chunks)} записей в {output_file}")
+def save_to_csv(df: pd.DataFrame, output_file: str):
+    """
+    Сохраняет данные в CSV файл (DataFrame строится один раз в main).
+    
+    Вложенные метаданные разворачиваются в отдельные колонки
+    metadata.section / metadata.category / metadata.source, так как
+    CSV не умеет хранить словари.
+    """
+    if 'metadata' in df.columns:
+        metadata = pd.json_normalize(df['metadata'].tolist()).add_prefix('metadata.')
+        metadata.index = df.index
+        df = pd.concat([df.drop(columns='metadata'), metadata], axis=1)
+    df.to_csv(output_file, index=False, encoding='utf-8-sig', lineterminator='\n')
+    print(f"[OK] Сохранено {len(df)} записей в {output_file}")
 
 
 def main():
@@ -163,37 +217,54 @@ def main():
     
     # Парсим Markdown
     print("[INFO] Парсинг Markdown таблиц...")
-    chunks = parse_markdown_tables(markdown_content)
+    columns = parse_markdown_columns(markdown_content)
     
-    if not chunks:
+    if not columns["id"]:
         print("[ERROR] Не удалось извлечь данные из файла!")
         return
     
-    print(f"[OK] Извлечено {len(chunks)} записей")
+    # DataFrame строится сразу из колонок (без промежуточного списка словарей)
+    # и используется и для CSV, и для статистики
+    df = pd.DataFrame(columns, dtype=_STRING_DTYPE)
+    df["text"] = "Вопрос: " + df["question"] + "\nОтвет: " + df["answer"]  # Текст для эмбеддинга
+    df["metadata"] = [
+        {"section": section, "category": category, "source": _SOURCE_NAME}
+        for section, category in zip(columns["section"], columns["category"])
+    ]
+    
+    print(f"[OK] Извлечено {len(df)} записей")
     
     # Сохраняем в различные форматы
     print("\n[INFO] Сохранение данных...")
+    writers = []
+    if args.format in ['json', 'jsonl', 'all']:
+        # JSON/JSONL остаются списком записей; преобразуем только при сохранении
+        chunks = df.to_dict(orient='records')
     if args.format in ['json', 'all']:
-        save_to_json(chunks, output_json)
+        writers.append((save_to_json, chunks, output_json))
     if args.format in ['jsonl', 'all']:
-        save_to_jsonl(chunks, output_jsonl)
+        writers.append((save_to_jsonl, chunks, output_jsonl))
     if args.format in ['csv', 'all']:
-        save_to_csv(chunks, output_csv)
+        writers.append((save_to_csv, df, output_csv))
+    
+    # Файлы независимы, поэтому записываем их параллельно: ожидание
+    # ввода-вывода одного файла перекрывается сериализацией других.
+    # Писатели только читают общие данные: save_to_csv разворачивает
+    # метаданные в новый DataFrame, не изменяя df, который нужен для статистики
+    with ThreadPoolExecutor(max_workers=len(writers)) as executor:
+        futures = [executor.submit(writer, data, path) for writer, data, path in writers]
+        for future in futures:
+            future.result()
     
     # Выводим статистику
     print("\n[STATS] Статистика:")
-    categories = {}
-    sections = {}
-    for chunk in chunks:
-        cat = chunk['category']
-        sec = chunk['section']
-        categories[cat] = categories.get(cat, 0) + 1
-        sections[sec] = sections.get(sec, 0) + 1
+    categories = df['category'].value_counts()
+    sections = df['section'].value_counts()
     
     print(f"  Категорий: {len(categories)}")
     print(f"  Разделов: {len(sections)}")
     print(f"\n  Распределение по категориям:")
-    for cat, count in sorted(categories.items(), key=lambda x: -x[1]):
+    for cat, count in categories.items():
         print(f"    - {cat}: {count}")
     
     print(f"\n[SUCCESS] Преобразование завершено!")
@@ -4,10 +4,18 @@
 """
 
 import json
+import mmap
 import sys
 import argparse
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain, islice, repeat
 from pathlib import Path
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple, Iterable
+
+try:
+    import orjson  # Быстрая сериализация JSON (опционально)
+except ImportError:
+    orjson = None
 
 # Добавляем корневую директорию в путь для импорта
 script_dir = Path(__file__).parent.parent
@@ -16,7 +24,6 @@ sys.path.insert(0, str(script_dir))
 # КРИТИЧНО: Отключаем Xet Storage ДО импорта любых модулей
 import os
 os.environ['HF_HUB_DISABLE_XET'] = '1'
-os.environ['HF_HUB_ENABLE_XET'] = '0'
 os.environ['SENTENCE_TRANSFORMERS_DISABLE_ONNX'] = '1'
 os.environ['ST_DISABLE_ONNX'] = '1'
 
@@ -24,33 +31,200 @@ from rag_pipeline.data_cleaner import DataCleaner
 from rag_pipeline.text_chunker import TextChunker
 from rag_pipeline.embeddings import (
     create_embedding_generator,
-    add_embeddings_to_records
+    add_embeddings_to_records,
+    DiskEmbeddingCache
 )
 from rag_pipeline.vector_db import create_vector_db
 
 
+# Порог размера JSONL файла, начиная с которого разбор идет в пуле процессов
+# (на маленьких файлах запуск процессов дороже самого разбора)
+_PARALLEL_JSONL_MIN_BYTES = 16 * 1024 * 1024
+
+
 def load_json_file(file_path: str) -> List[Dict[str, Any]]:
-    """Загружает данные из JSON файла."""
+    """Загружает данные из JSON файла (через orjson и mmap, если orjson установлен)."""
+    if orjson is not None and os.path.getsize(file_path) > 0:
+        # Файл отображается в память: страницы подгружает ядро, без
+        # промежуточной копии содержимого в bytes/str
+        with open(file_path, 'rb') as f, \
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, \
+                memoryview(mm) as view:
+            return orjson.loads(view)
     with open(file_path, 'r', encoding='utf-8') as f:
         return json.load(f)
 
 
-def load_jsonl_file(file_path: str) -> List[Dict[str, Any]]:
-    """Загружает данные из JSONL файла."""
+def _load_jsonl_range(file_path: str, start: int, end: int) -> List[Dict[str, Any]]:
+    """Разбирает строки JSONL файла в диапазоне байт [start, end) (для пула процессов)."""
+    with open(file_path, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+    loads = orjson.loads if orjson is not None else json.loads
+    return [loads(line) for line in data.split(b'\n') if line and not line.isspace()]
+
+
+def _jsonl_ranges(file_path: str, size: int, parts: int) -> List[Tuple[int, int]]:
+    """Делит файл на parts диапазонов примерно равного размера по границам строк."""
+    ranges = []
+    start = 0
+    with open(file_path, 'rb') as f:
+        for i in range(1, parts):
+            if start >= size:
+                break
+            f.seek(max(start, size * i // parts))
+            f.readline()  # дочитываем до конца текущей строки
+            end = f.tell()
+            if end > start:
+                ranges.append((start, end))
+                start = end
+    if start < size:
+        ranges.append((start, size))
+    return ranges
+
+
+def _load_jsonl_cudf(file_path: str) -> Optional[List[Dict[str, Any]]]:
+    """Разбирает JSONL файл на GPU через cuDF (None, если cuDF не установлен)."""
+    try:
+        import cudf
+    except ImportError:
+        return None
+    table = cudf.read_json(file_path, lines=True).to_arrow()
+    # Поля, отсутствующие в строке, cuDF заполняет null - в записи они не переносятся
+    return [{key: value for key, value in row.items() if value is not None}
+            for row in table.to_pylist()]
+
+
+def load_jsonl_file(file_path: str, num_workers: Optional[int] = None,
+                    use_cudf: bool = False) -> List[Dict[str, Any]]:
+    """
+    Загружает данные из JSONL файла (через orjson и mmap, если orjson установлен).
+    
+    Файлы больше _PARALLEL_JSONL_MIN_BYTES делятся на куски по границам строк,
+    которые разбираются параллельно в пуле процессов.
+    
+    Args:
+        file_path: Путь к JSONL файлу
+        num_workers: Число процессов (None - по числу CPU, 1 - без пула)
+        use_cudf: Разбирать файл на GPU через cuDF (для файлов в миллионы
+            строк; без cuDF - обычная загрузка на CPU)
+        
+    Returns:
+        Список записей
+    """
+    size = os.path.getsize(file_path)
+    
+    if use_cudf and size > 0:
+        records = _load_jsonl_cudf(file_path)
+        if records is not None:
+            return records
+        print("[WARNING] cuDF не установлен, JSONL разбирается на CPU")
+    
+    if num_workers is None:
+        num_workers = os.cpu_count() or 1
+    
+    if num_workers > 1 and size > _PARALLEL_JSONL_MIN_BYTES:
+        ranges = _jsonl_ranges(file_path, size, num_workers)
+        with ProcessPoolExecutor(max_workers=len(ranges)) as executor:
+            parts = executor.map(
+                _load_jsonl_range,
+                repeat(file_path),
+                [start for start, _ in ranges],
+                [end for _, end in ranges]
+            )
+            return list(chain.from_iterable(parts))
+    
+    if orjson is not None:
+        if size == 0:
+            return []
+        with open(file_path, 'rb') as f, \
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            loads = orjson.loads
+            return [loads(line) for line in iter(mm.readline, b'') if not line.isspace()]
     records = []
     with open(file_path, 'r', encoding='utf-8') as f:
         for line in f:
-            if line.strip():
+            if not line.isspace():
                 records.append(json.loads(line))
     return records
 
 
 def save_json_file(data: List[Dict[str, Any]], file_path: str):
-    """Сохраняет данные в JSON файл."""
+    """Сохраняет данные в JSON файл (через orjson, если он установлен)."""
+    if orjson is not None:
+        # orjson пишет UTF-8 без экранирования (как ensure_ascii=False)
+        # и сериализует numpy-массивы эмбеддингов без .tolist()
+        with open(file_path, 'wb') as f:
+            f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY))
+        return
     with open(file_path, 'w', encoding='utf-8') as f:
         json.dump(data, f, ensure_ascii=False, indent=2)
 
 
+def _stream_embed_and_save(records: Iterable[Dict[str, Any]],
+                           embedding_generator,
+                           output_file: str,
+                           save_embeddings: bool = True,
+                           cache: Optional[DiskEmbeddingCache] = None,
+                           vector_db=None,
+                           batch_size: int = 1024) -> Tuple[int, bool]:
+    """
+    Потоково генерирует эмбеддинги порциями и сразу сохраняет записи.
+    
+    Каждая порция после генерации эмбеддингов загружается в векторную БД
+    (если она передана) и дописывается в выходной файл, после чего
+    освобождается. Файл .jsonl пишется построчно, остальные - JSON-массивом.
+    
+    Args:
+        records: Итерируемый источник записей (например, TextChunker.iter_chunks)
+        embedding_generator: Генератор эмбеддингов
+        output_file: Путь к выходному файлу
+        save_embeddings: Сохранять ли эмбеддинги в файл
+        cache: Дисковый кэш эмбеддингов
+        vector_db: Векторная БД для загрузки порций (None - не загружать)
+        batch_size: Количество записей в порции
+        
+    Returns:
+        Кортеж (количество записей, успешна ли загрузка в БД)
+    """
+    if orjson is not None:
+        dumps = orjson.dumps
+    else:
+        def dumps(record):
+            return json.dumps(record, ensure_ascii=False).encode('utf-8')
+    
+    as_jsonl = output_file.endswith('.jsonl')
+    records_iter = iter(records)
+    total = 0
+    success = True
+    
+    with open(output_file, 'wb', buffering=1024 * 1024) as f:
+        if not as_jsonl:
+            f.write(b'[\n')
+        while True:
+            batch = list(islice(records_iter, batch_size))
+            if not batch:
+                break
+            
+            add_embeddings_to_records(batch, embedding_generator, cache=cache)
+            if vector_db is not None and not vector_db.upsert(batch):
+                success = False
+            if not save_embeddings:
+                for record in batch:
+                    record.pop('embedding', None)
+            
+            lines = [dumps(record) for record in batch]
+            if as_jsonl:
+                f.write(b'\n'.join(lines) + b'\n')
+            else:
+                f.write((b',\n' if total else b'') + b',\n'.join(lines))
+            total += len(batch)
+        if not as_jsonl:
+            f.write(b'\n]\n')
+    
+    return total, success
+
+
 def run_full_pipeline(
     input_file: str,
     output_file: str = "rag_processed.json",
@@ -63,7 +237,14 @@ def run_full_pipeline(
     vector_db_provider: Optional[str] = None,
     vector_db_config: Optional[Dict[str, Any]] = None,
     save_embeddings: bool = True,
-    upload_to_db: bool = False
+    upload_to_db: bool = False,
+    embedding_cache: Optional[str] = None,
+    embedding_batch_size: Optional[int] = None,
+    embeddings_format: str = "json",
+    streaming: bool = False,
+    stream_batch_size: int = 1024,
+    num_workers: int = 1,
+    use_cudf: bool = False
 ):
     """
     Запускает полный пайплайн обработки данных для RAG.
@@ -81,7 +262,25 @@ def run_full_pipeline(
         vector_db_config: Конфигурация векторной БД
         save_embeddings: Сохранять ли эмбеддинги в файл
         upload_to_db: Загружать ли в векторную БД
+        embedding_cache: Путь к дисковому кэшу эмбеддингов (SQLite)
+        embedding_batch_size: Размер батча генератора эмбеддингов
+            (None - значение по умолчанию провайдера)
+        embeddings_format: Формат сохранения эмбеддингов: 'json' - списками
+            внутри записей, 'npy' - матрицей float16 в файле
+            <output>.embeddings.npy (в записях с эмбеддингом остается
+            embedding_idx - номер строки матрицы)
+        streaming: Потоковый режим шагов 3-6: чанки создаются лениво и
+            порциями по stream_batch_size проходят генерацию эмбеддингов,
+            запись в файл и загрузку в БД (в памяти одна порция чанков)
+        stream_batch_size: Количество записей в порции потокового режима
+        num_workers: Количество процессов для разбора JSONL, очистки и разбиения
+            на чанки (1 - без пула; проверка дубликатов всегда идет в основном процессе,
+            в потоковом режиме чанки создаются в основном процессе)
+        use_cudf: Разбирать входной JSONL на GPU через cuDF (если установлен)
     """
+    if streaming and save_embeddings and embeddings_format == "npy":
+        raise ValueError("Потоковый режим поддерживает только embeddings_format='json'")
+    
     print("=" * 60)
     print("RAG PIPELINE - Полная обработка данных")
     print("=" * 60)
@@ -89,7 +288,7 @@ def run_full_pipeline(
     # 1. Загрузка данных
     print(f"\n[STEP 1] Загрузка данных из {input_file}...")
     if input_file.endswith('.jsonl'):
-        records = load_jsonl_file(input_file)
+        records = load_jsonl_file(input_file, num_workers=num_workers, use_cudf=use_cudf)
     else:
         records = load_json_file(input_file)
     
@@ -105,7 +304,9 @@ def run_full_pipeline(
         print(f"  Записей до очистки: {stats_before['total']}")
         
         # Очищаем данные
-        records = cleaner.clean_records(records, remove_duplicates=True)
+        # Исходные записи больше не нужны, поэтому очищаем их на месте
+        records = cleaner.clean_records(records, remove_duplicates=True, copy=False,
+                                        num_workers=num_workers)
         
         # Статистика после очистки
         stats_after = cleaner.get_statistics(records)
@@ -122,8 +323,14 @@ def run_full_pipeline(
             chunk_size=chunk_size,
             chunk_overlap=chunk_overlap
         )
-        records = chunker.chunk_records(records, enable_chunking=True)
-        print(f"[OK] Обработано записей: {len(records)}")
+        if streaming:
+            # Чанки создаются по мере потребления на шагах 4-6
+            records = chunker.iter_chunks(records, enable_chunking=True)
+            print(f"[OK] Чанки будут создаваться потоково")
+        else:
+            records = chunker.chunk_records(records, enable_chunking=True,
+                                            num_workers=num_workers)
+            print(f"[OK] Обработано записей: {len(records)}")
     else:
         print(f"\n[STEP 3] Разбиение на чанки пропущено")
     
@@ -137,23 +344,86 @@ def run_full_pipeline(
     elif embedding_provider == "sentence_transformers":
         if embedding_model:
             embedding_kwargs['model_name'] = embedding_model
+    if embedding_batch_size:
+        embedding_kwargs['batch_size'] = embedding_batch_size
     
     embedding_generator = create_embedding_generator(embedding_provider, **embedding_kwargs)
-    records = add_embeddings_to_records(records, embedding_generator)
+    cache = DiskEmbeddingCache(embedding_cache) if embedding_cache else None
+    
+    if streaming:
+        vector_db = None
+        if upload_to_db and vector_db_provider and vector_db_config:
+            vector_db = create_vector_db(vector_db_provider, **vector_db_config)
+        
+        print(f"[INFO] Потоковый режим: эмбеддинги, сохранение в {output_file}"
+              f"{' и загрузка в БД' if vector_db is not None else ''} порциями по {stream_batch_size}")
+        total, success = _stream_embed_and_save(
+            records, embedding_generator, output_file,
+            save_embeddings=save_embeddings,
+            cache=cache,
+            vector_db=vector_db,
+            batch_size=stream_batch_size
+        )
+        if cache is not None:
+            cache.close()
+        
+        print(f"[OK] Обработано и сохранено записей: {total}")
+        if vector_db is not None:
+            if success:
+                print(f"[OK] Данные загружены в векторную БД")
+            else:
+                print(f"[ERROR] Ошибка при загрузке в векторную БД")
+        
+        print("\n" + "=" * 60)
+        print("[SUCCESS] Пайплайн завершен успешно!")
+        print("=" * 60)
+        return
     
-    # Удаляем эмбеддинги из записи перед сохранением (если не нужно)
-    if not save_embeddings:
-        for record in records:
-            if 'embedding' in record:
-                del record['embedding']
+    # Тексты всех записей (включая чанки) передаются генератору одним списком,
+    # который он сам режет на батчи по batch_size
+    records = add_embeddings_to_records(records, embedding_generator, cache=cache)
+    if cache is not None:
+        cache.close()
     
     print(f"[OK] Эмбеддинги сгенерированы")
     
+    # Убираем эмбеддинги из записей перед сохранением в JSON (если они не
+    # нужны в файле или сохраняются отдельной матрицей); для загрузки в
+    # векторную БД они возвращаются в записи после сохранения
+    embeddings = None
+    if not save_embeddings or embeddings_format == "npy":
+        embeddings = [record.pop('embedding', None) for record in records]
+    
     # 5. Сохранение обработанных данных
     print(f"\n[STEP 5] Сохранение данных в {output_file}...")
+    if save_embeddings and embeddings_format == "npy":
+        import numpy as np
+        
+        # float16 в бинарном файле в разы компактнее списков чисел в JSON
+        embeddings_file = Path(output_file).with_suffix('.embeddings.npy')
+        # В матрицу попадают только векторы нужной размерности: при ошибке
+        # батча генератор возвращает пустые списки, и такие записи остаются
+        # без embedding_idx
+        dimension = embedding_generator.get_dimension()
+        rows = []
+        for record, embedding in zip(records, embeddings):
+            if embedding is not None and len(embedding) == dimension:
+                record['embedding_idx'] = len(rows)
+                rows.append(embedding)
+        skipped = len(records) - len(rows)
+        if skipped:
+            print(f"[WARNING] Записей без эмбеддинга или с неверной размерностью: {skipped} "
+                  f"(не сохранены в матрицу, embedding_idx не задан)")
+        np.save(embeddings_file, np.asarray(rows, dtype=np.float16).reshape(len(rows), dimension))
+        print(f"[OK] Матрица эмбеддингов сохранена в {embeddings_file}")
     save_json_file(records, output_file)
     print(f"[OK] Данные сохранены")
     
+    if embeddings is not None:
+        for record, embedding in zip(records, embeddings):
+            if embedding is not None:
+                record['embedding'] = embedding
+    
     # 6. Загрузка в векторную БД
     if upload_to_db and vector_db_provider and vector_db_config:
         print(f"\n[STEP 6] Загрузка в векторную БД ({vector_db_provider})...")
@@ -200,6 +470,22 @@ def main():
                        help='Провайдер эмбеддингов')
     parser.add_argument('--embedding-model', type=str,
                        help='Модель для эмбеддингов (опционально)')
+    parser.add_argument('--embedding-cache', type=str,
+                       help='Файл кэша эмбеддингов для повторных запусков (опционально)')
+    parser.add_argument('--embedding-batch-size', type=int,
+                       help='Размер батча для генерации эмбеддингов (опционально)')
+    parser.add_argument('--embeddings-format', type=str,
+                       choices=['json', 'npy'],
+                       default='json',
+                       help='Формат сохранения эмбеддингов: json (в записях) или npy (float16 матрица рядом с выходным файлом)')
+    parser.add_argument('--streaming', action='store_true',
+                       help='Потоковый режим: чанки, эмбеддинги и сохранение порциями (ограниченная память)')
+    parser.add_argument('--stream-batch-size', type=int, default=1024,
+                       help='Размер порции в потоковом режиме (по умолчанию: 1024)')
+    parser.add_argument('--num-workers', type=int, default=1,
+                       help='Количество процессов для загрузки JSONL, очистки и чанкинга (по умолчанию: 1 - без пула)')
+    parser.add_argument('--use-cudf', action='store_true',
+                       help='Разбирать входной JSONL на GPU через cuDF (если установлен)')
     
     parser.add_argument('--no-save-embeddings', action='store_true',
                        help='Не сохранять эмбеддинги в выходной файл')
@@ -267,7 +553,14 @@ def main():
         vector_db_provider=vector_db_provider,
         vector_db_config=vector_db_config,
         save_embeddings=not args.no_save_embeddings,
-        upload_to_db=args.upload_db
+        upload_to_db=args.upload_db,
+        embedding_cache=args.embedding_cache,
+        embedding_batch_size=args.embedding_batch_size,
+        embeddings_format=args.embeddings_format,
+        streaming=args.streaming,
+        stream_batch_size=args.stream_batch_size,
+        num_workers=args.num_workers,
+        use_cudf=args.use_cudf
     )
 
 
@@ -0,0 +1,29 @@
+"""
+Дисковый кэш эмбеддингов для тестовых скриптов генерации эмбеддингов.
+"""
+
+import os
+from pathlib import Path
+from typing import Optional
+
+from rag_pipeline.embeddings import DiskEmbeddingCache
+
+
+def open_embedding_cache() -> Optional[DiskEmbeddingCache]:
+    """
+    Открывает дисковый кэш эмбеддингов, если он включен явно.
+
+    Кэш (SQLite, ключ - хэш модели и текста) включается переменной окружения
+    EMBEDDING_CACHE_PATH с путем к файлу, например
+    EMBEDDING_CACHE_PATH=data/output/cache/embeddings.sqlite. По умолчанию
+    кэш выключен: тесты генерации всегда вызывают модель и замечают ее поломки.
+
+    Returns:
+        Открытый кэш или None, если кэш не включен
+    """
+    cache_path = os.getenv('EMBEDDING_CACHE_PATH', '')
+    if not cache_path:
+        return None
+    Path(cache_path).parent.mkdir(parents=True, exist_ok=True)
+    print(f"[INFO] Используется дисковый кэш эмбеддингов: {cache_path}")
+    return DiskEmbeddingCache(cache_path)
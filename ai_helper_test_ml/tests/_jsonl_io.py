@@ -0,0 +1,70 @@
+"""
+Общие функции чтения и записи JSON/JSONL для тестовых скриптов.
+"""
+
+import json
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, Union
+
+try:
+    import orjson  # Быстрая сериализация JSON (опционально)
+except ImportError:
+    orjson = None
+
+# Буфер файлового ввода-вывода JSONL: чтение и запись крупными блоками
+IO_BUFFER_SIZE = 1024 * 1024
+
+
+def iter_jsonl(file_path: Union[str, Path]) -> Iterator[Dict[str, Any]]:
+    """
+    Читает JSONL по одной записи (генератор).
+
+    Файл не загружается целиком: чтение останавливается, как только
+    потребитель перестает запрашивать записи. Пустые строки пропускаются.
+    Строки с некорректным JSON тоже пропускаются, но не молча: для каждой
+    выводится [WARNING] с именем файла и номером строки.
+
+    Args:
+        file_path: Путь к JSONL файлу
+
+    Yields:
+        Записи файла по порядку
+    """
+    # Строки разбираются прямо из байтов (orjson, если установлен);
+    # orjson.JSONDecodeError - подкласс json.JSONDecodeError
+    loads = orjson.loads if orjson is not None else json.loads
+    with open(file_path, 'rb', buffering=IO_BUFFER_SIZE) as f:
+        for line_number, line in enumerate(f, 1):
+            if line.isspace():
+                continue
+            try:
+                yield loads(line)
+            except json.JSONDecodeError as e:
+                print(f"[WARNING] {Path(file_path).name}: пропущена строка {line_number} "
+                      f"с некорректным JSON: {e}")
+
+
+def dump_jsonl_line(record: Dict[str, Any]) -> bytes:
+    """Сериализует запись в строку JSONL (UTF-8, с переводом строки)."""
+    if orjson is not None:
+        return orjson.dumps(record, option=orjson.OPT_APPEND_NEWLINE)
+    return (json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8')
+
+
+def dump_json(data: Any) -> bytes:
+    """Сериализует данные в JSON с отступом 2 (UTF-8, без экранирования)."""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2)
+    return json.dumps(data, ensure_ascii=False, indent=2).encode('utf-8')
+
+
+def write_jsonl(records: Iterable[Dict[str, Any]], file_path: Union[str, Path]):
+    """Записывает записи в JSONL файл (по одной на строку)."""
+    with open(file_path, 'wb', buffering=IO_BUFFER_SIZE) as f:
+        f.writelines(map(dump_jsonl_line, records))
+
+
+def write_json(data: Any, file_path: Union[str, Path]):
+    """Записывает данные в JSON файл с отступом 2."""
+    with open(file_path, 'wb') as f:
+        f.write(dump_json(data))
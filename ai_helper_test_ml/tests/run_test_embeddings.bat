@@ -6,7 +6,6 @@ echo [INFO] Настройка переменных окружения для о
 
 REM Отключаем Xet Storage для избежания проблем с таймаутами
 set HF_HUB_DISABLE_XET=1
-set HF_HUB_ENABLE_XET=0
 set HF_HUB_DISABLE_XET_WARNING=1
 
 REM Отключаем ONNX оптимизацию для избежания загрузки ONNX файлов через Xet Storage
@@ -5,7 +5,6 @@ echo "[INFO] Настройка переменных окружения для 
 
 # Отключаем Xet Storage для избежания проблем с таймаутами
 export HF_HUB_DISABLE_XET=1
-export HF_HUB_ENABLE_XET=0
 export HF_HUB_DISABLE_XET_WARNING=1
 
 # Отключаем ONNX оптимизацию для избежания загрузки ONNX файлов через Xet Storage
@@ -10,6 +10,7 @@ from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from rag_pipeline.text_chunker import TextChunker
+from _jsonl_io import iter_jsonl, write_json, write_jsonl
 
 
 def test_chunking_from_dataset():
@@ -29,11 +30,7 @@ def test_chunking_from_dataset():
     
     # Загружаем данные
     print(f"\n[INFO] Загрузка данных из {input_file.name}...")
-    records = []
-    with open(input_file, 'r', encoding='utf-8') as f:
-        for line in f:
-            if line.strip():
-                records.append(json.loads(line))
+    records = list(iter_jsonl(input_file))
     
     print(f"[OK] Загружено записей: {len(records)}")
     
@@ -53,8 +50,8 @@ def test_chunking_from_dataset():
     
     # Определяем, сколько текстов длиннее стандартного чанка
     chunk_size = 500
-    long_texts = [r for r in records if len(r.get('text', '')) > chunk_size]
-    print(f"\nТекстов длиннее {chunk_size} символов: {len(long_texts)}")
+    long_texts = sum(1 for length in text_lengths if length > chunk_size)
+    print(f"\nТекстов длиннее {chunk_size} символов: {long_texts}")
     
     # Настройка чанкера
     print("\n" + "-" * 60)
@@ -82,10 +79,12 @@ def test_chunking_from_dataset():
     chunked_records = []
     total_chunks_created = 0
     records_chunked = 0
+    append = chunked_records.append
     
-    for record in records:
-        original_text_length = len(record.get('text', ''))
-        
+    # Длины текстов уже посчитаны выше, повторно их не вычисляем.
+    # Короткие записи (в FAQ-корпусах их большинство) обрабатываются без
+    # вызова чанкера, порядок записей сохраняется
+    for record, original_text_length in zip(records, text_lengths):
         if original_text_length > min_text_length:
             # Разбиваем на чанки
             chunks = chunker.chunk_record(record, enable_chunking=True)
@@ -98,10 +97,8 @@ def test_chunking_from_dataset():
         else:
             # Короткие записи оставляем как есть
             record['is_chunk'] = False
-            if 'metadata' not in record:
-                record['metadata'] = {}
-            record['metadata']['is_chunk'] = False
-            chunked_records.append(record)
+            record.setdefault('metadata', {})['is_chunk'] = False
+            append(record)
     
     # Статистика после разбиения
     print("\n" + "-" * 60)
@@ -151,17 +148,14 @@ def test_chunking_from_dataset():
     print("СОХРАНЕНИЕ РЕЗУЛЬТАТОВ...")
     print("-" * 60)
     
-    with open(output_file, 'w', encoding='utf-8') as f:
-        for record in chunked_records:
-            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+    write_jsonl(chunked_records, output_file)
     
     print(f"[OK] Разбитые данные сохранены в: {output_file}")
     print(f"[OK] Сохранено записей: {len(chunked_records)}")
     
     # Также сохраняем в JSON для удобства просмотра
     output_json = output_file.with_suffix('.json')
-    with open(output_json, 'w', encoding='utf-8') as f:
-        json.dump(chunked_records, f, ensure_ascii=False, indent=2)
+    write_json(chunked_records, output_json)
     
     print(f"[OK] Также сохранено в JSON: {output_json.name}")
     
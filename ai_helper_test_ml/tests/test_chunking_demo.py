@@ -3,6 +3,8 @@
 для показа работы чанкера на коротких текстах.
 """
 
+import hashlib
+import inspect
 import json
 import sys
 from pathlib import Path
@@ -11,6 +13,34 @@ from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from rag_pipeline.text_chunker import TextChunker
+from _jsonl_io import dump_json, iter_jsonl
+
+# Дисковый кэш результатов разбиения демо-текста: при повторном запуске
+# чанки читаются из файла. В ключ входит хэш исходного кода чанкера, поэтому
+# после изменения алгоритма кэш не используется
+_CACHE_DIR = Path(__file__).parent.parent / 'data/output/cache/chunking_demo'
+_CHUNKER_SOURCE_HASH = hashlib.sha256(
+    Path(inspect.getfile(TextChunker)).read_bytes()
+).hexdigest()
+
+
+def _cached_chunk_record(chunker: TextChunker, record: dict) -> list:
+    """Разбивает запись на чанки, используя дисковый кэш по хэшу содержимого."""
+    payload = json.dumps(
+        [record, chunker.chunk_size, chunker.chunk_overlap, chunker.min_chunk_size,
+         _CHUNKER_SOURCE_HASH],
+        ensure_ascii=False, sort_keys=True
+    )
+    key = hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+    cache_file = _CACHE_DIR / f"{key}_{chunker.chunk_size}_{chunker.chunk_overlap}.json"
+    
+    if cache_file.exists():
+        return json.loads(cache_file.read_bytes())
+    
+    chunks = chunker.chunk_record(record, enable_chunking=True)
+    _CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    cache_file.write_bytes(dump_json(chunks))
+    return chunks
 
 
 def demo_chunking():
@@ -29,11 +59,7 @@ def demo_chunking():
     
     # Загружаем данные
     print(f"\n[INFO] Загрузка данных из {input_file.name}...")
-    records = []
-    with open(input_file, 'r', encoding='utf-8') as f:
-        for line in f:
-            if line.strip():
-                records.append(json.loads(line))
+    records = list(iter_jsonl(input_file))
     
     print(f"[OK] Загружено записей: {len(records)}")
     
@@ -78,8 +104,9 @@ def demo_chunking():
     к интернету или банкомату.
     """
     
-    demo_record['answer'] = long_answer.strip()
-    demo_record['text'] = f"Вопрос: {demo_record['question']}\nОтвет: {long_answer.strip()}"
+    long_answer = long_answer.strip()
+    demo_record['answer'] = long_answer
+    demo_record['text'] = f"Вопрос: {demo_record['question']}\nОтвет: {long_answer}"
     
     print(f"Создан длинный текст: {len(demo_record['text'])} символов")
     
@@ -102,16 +129,20 @@ def demo_chunking():
             chunk_overlap=config['chunk_overlap']
         )
         
-        chunks = chunker.chunk_record(demo_record, enable_chunking=True)
+        chunks = _cached_chunk_record(chunker, demo_record)
         
         print(f"Создано чанков: {len(chunks)}")
         print(f"Размер исходного текста: {len(demo_record['text'])} символов")
         
+        # Описание чанков собирается целиком и выводится одной записью в stdout
+        lines = []
         for i, chunk in enumerate(chunks, 1):
-            chunk_length = len(chunk['text'])
-            print(f"\nЧанк {i} (ID: {chunk['id']}):")
-            print(f"  Размер: {chunk_length} символов")
-            print(f"  Текст: {chunk['text'][:80].replace(chr(8594), '->')}...")
+            text = chunk['text']
+            lines.append(f"\nЧанк {i} (ID: {chunk['id']}):")
+            lines.append(f"  Размер: {len(text)} символов")
+            lines.append(f"  Текст: {text[:80].replace(chr(8594), '->')}...")
+        if lines:
+            print('\n'.join(lines))
         
         all_results.append({
             'config': config['name'],
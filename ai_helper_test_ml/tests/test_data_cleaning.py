@@ -2,14 +2,24 @@
 Тестовый скрипт для очистки данных из реального датасета.
 """
 
-import json
+import os
 import sys
+from contextlib import ExitStack
 from pathlib import Path
 
 # Добавляем корневую директорию в путь для импорта
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from rag_pipeline.data_cleaner import DataCleaner
+from rag_pipeline.data_cleaner import DataCleaner, RecordStatistics
+from _jsonl_io import IO_BUFFER_SIZE, dump_json, dump_jsonl_line, iter_jsonl
+
+
+def _dump_array_item(record: dict) -> bytes:
+    """Сериализует запись как элемент JSON-массива с отступом 2 (как indent=2 для списка)."""
+    dumped = dump_json(record)
+    # Переводы строк внутри строковых значений экранированы, поэтому
+    # разбиение по b'\n' затрагивает только строки форматирования
+    return b'\n'.join(b'  ' + line for line in dumped.split(b'\n'))
 
 
 def test_cleaning_from_dataset():
@@ -27,24 +37,20 @@ def test_cleaning_from_dataset():
         print("Сначала запустите: python scripts/markdown_to_rag.py")
         return
     
-    # Загружаем данные
-    print(f"\n[INFO] Загрузка данных из {input_file.name}...")
-    records = []
-    with open(input_file, 'r', encoding='utf-8') as f:
-        for line in f:
-            if line.strip():
-                records.append(json.loads(line))
+    # Записи не собираются в список: статистика, очистка и запись
+    # выполняются в потоке, в памяти только отпечатки для поиска дубликатов
+    print(f"\n[INFO] Чтение данных из {input_file.name}...")
+    
+    cleaner = DataCleaner()
+    stats_before = cleaner.get_statistics(iter_jsonl(input_file))
     
-    print(f"[OK] Загружено записей: {len(records)}")
+    print(f"[OK] Прочитано записей: {stats_before['total']}")
     
     # Показываем статистику до очистки
     print("\n" + "-" * 60)
     print("СТАТИСТИКА ДО ОЧИСТКИ:")
     print("-" * 60)
     
-    cleaner = DataCleaner()
-    stats_before = cleaner.get_statistics(records)
-    
     print(f"Всего записей: {stats_before['total']}")
     print(f"Категорий: {len(stats_before['categories'])}")
     print(f"Разделов: {len(stats_before['sections'])}")
@@ -56,19 +62,44 @@ def test_cleaning_from_dataset():
     for cat, count in sorted(stats_before['categories'].items(), key=lambda x: -x[1]):
         print(f"  - {cat}: {count}")
     
-    # Очищаем данные
+    # Очищаем и сразу сохраняем данные одним проходом
     print("\n" + "-" * 60)
-    print("ОЧИСТКА ДАННЫХ...")
+    print("ОЧИСТКА И СОХРАНЕНИЕ ДАННЫХ...")
     print("-" * 60)
     
-    cleaned_records = cleaner.clean_records(records, remove_duplicates=True)
+    output_file = Path(__file__).parent.parent / 'data/output/cleaned_data.jsonl'
+    output_file.parent.mkdir(parents=True, exist_ok=True)
+    # Копия в JSON с отступами для удобства просмотра (массив пишется по элементу)
+    # удваивает объем записи, поэтому создается только по запросу
+    output_json = output_file.with_suffix('.json')
+    save_json = os.getenv('SAVE_CLEANED_JSON', 'false').lower() == 'true'
+    
+    stats = RecordStatistics()
+    examples = []
+    with ExitStack() as stack:
+        f_jsonl = stack.enter_context(open(output_file, 'wb', buffering=IO_BUFFER_SIZE))
+        f_json = None
+        if save_json:
+            f_json = stack.enter_context(open(output_json, 'wb', buffering=IO_BUFFER_SIZE))
+        separator = b'[\n'
+        for record in cleaner.iter_clean_records(iter_jsonl(input_file), remove_duplicates=True):
+            stats.add(record)
+            if len(examples) < 5:
+                examples.append(record)
+            f_jsonl.write(dump_jsonl_line(record))
+            if f_json is not None:
+                f_json.write(separator)
+                f_json.write(_dump_array_item(record))
+                separator = b',\n'
+        if f_json is not None:
+            f_json.write(b'\n]' if stats.total else b'[]')
     
     # Статистика после очистки
     print("\n" + "-" * 60)
     print("СТАТИСТИКА ПОСЛЕ ОЧИСТКИ:")
     print("-" * 60)
     
-    stats_after = cleaner.get_statistics(cleaned_records)
+    stats_after = stats.to_dict()
     
     print(f"Всего записей: {stats_after['total']}")
     print(f"Категорий: {len(stats_after['categories'])}")
@@ -90,40 +121,30 @@ def test_cleaning_from_dataset():
     print("ПРИМЕРЫ ОЧИЩЕННЫХ ЗАПИСЕЙ:")
     print("-" * 60)
     
-    for i, record in enumerate(cleaned_records[:5], 1):
+    for i, record in enumerate(examples, 1):
         print(f"\n{i}. ID: {record['id']}")
         print(f"   Вопрос: {record['question']}")
         print(f"   Категория: {record['category']}")
         answer_preview = record['answer'][:80].replace('→', '->')
         print(f"   Ответ: {answer_preview}...")
     
-    # Сохраняем очищенные данные
-    output_file = Path(__file__).parent.parent / 'data/output/cleaned_data.jsonl'
-    output_file.parent.mkdir(parents=True, exist_ok=True)
-    
+    # Результаты записаны во время очистки
     print("\n" + "-" * 60)
     print("СОХРАНЕНИЕ РЕЗУЛЬТАТОВ...")
     print("-" * 60)
     
-    with open(output_file, 'w', encoding='utf-8') as f:
-        for record in cleaned_records:
-            f.write(json.dumps(record, ensure_ascii=False) + '\n')
-    
     print(f"[OK] Очищенные данные сохранены в: {output_file}")
-    print(f"[OK] Сохранено записей: {len(cleaned_records)}")
-    
-    # Также сохраняем в JSON для удобства просмотра
-    output_json = output_file.with_suffix('.json')
-    with open(output_json, 'w', encoding='utf-8') as f:
-        json.dump(cleaned_records, f, ensure_ascii=False, indent=2)
-    
-    print(f"[OK] Также сохранено в JSON: {output_json.name}")
+    print(f"[OK] Сохранено записей: {stats_after['total']}")
+    if save_json:
+        print(f"[OK] Также сохранено в JSON: {output_json.name}")
+    else:
+        print(f"[INFO] JSON с отступами не сохраняется (установите SAVE_CLEANED_JSON=true для сохранения)")
     
     print("\n" + "=" * 60)
     print("[SUCCESS] Тестовая очистка завершена успешно!")
     print("=" * 60)
     
-    return cleaned_records
+    return stats_after
 
 
 def main():
@@ -9,7 +9,6 @@ from pathlib import Path
 
 # КРИТИЧНО: Отключаем Xet Storage ДО импорта любых модулей, использующих huggingface_hub
 os.environ['HF_HUB_DISABLE_XET'] = '1'
-os.environ['HF_HUB_ENABLE_XET'] = '0'
 
 # Отключаем ONNX оптимизацию для избежания загрузки ONNX файлов через Xet Storage
 os.environ['SENTENCE_TRANSFORMERS_DISABLE_ONNX'] = '1'
@@ -22,6 +21,8 @@ from rag_pipeline.embeddings import (
     create_embedding_generator,
     add_embeddings_to_records
 )
+from _embedding_cache import open_embedding_cache
+from _jsonl_io import iter_jsonl, write_jsonl
 
 
 def test_embeddings_generation():
@@ -41,11 +42,7 @@ def test_embeddings_generation():
     
     # Загружаем данные
     print(f"\n[INFO] Загрузка данных из {input_file.name}...")
-    records = []
-    with open(input_file, 'r', encoding='utf-8') as f:
-        for line in f:
-            if line.strip():
-                records.append(json.loads(line))
+    records = list(iter_jsonl(input_file))
     
     print(f"[OK] Загружено записей: {len(records)}")
     
@@ -90,15 +87,34 @@ def test_embeddings_generation():
             download_timeout = int(os.getenv('HF_HUB_DOWNLOAD_TIMEOUT', '600'))  # 10 минут по умолчанию
             max_retries = int(os.getenv('HF_DOWNLOAD_MAX_RETRIES', '3'))
             retry_delay = float(os.getenv('HF_DOWNLOAD_RETRY_DELAY', '5.0'))
+            # Размер батча encode: на CPU крупные батчи лучше загружают матричные ядра
+            batch_size = int(os.getenv('EMBEDDING_BATCH_SIZE', '64'))
+            # encode сам сортирует тексты по длине, чтобы батчи не раздувались
+            # паддингом; бюджет токенов на батч дополнительно выравнивает батчи
+            # по числу токенов (длинные тексты - меньшими батчами)
+            max_tokens_per_batch = os.getenv('EMBEDDING_MAX_TOKENS_PER_BATCH')
+            # Потоки torch на CPU (по умолчанию все ядра); на машинах с
+            # hyper-threading число физических ядер обычно быстрее
+            num_threads = os.getenv('EMBEDDING_NUM_THREADS')
+            # Устройство и точность: по умолчанию GPU (cuda/mps) в fp16, если доступен.
+            # На CPU EMBEDDING_PRECISION=int8 включает динамическую int8 квантизацию
+            # Linear слоев (векторы почти совпадают с fp32 по косинусной близости)
+            device = os.getenv('EMBEDDING_DEVICE', 'auto')
+            precision = os.getenv('EMBEDDING_PRECISION', 'auto')
             
             embedding_generator = create_embedding_generator(
                 provider="sentence_transformers",
                 model_name=model_name,
-                device="cpu",
+                device=device,
+                precision=precision,
+                batch_size=batch_size,
+                max_tokens_per_batch=int(max_tokens_per_batch) if max_tokens_per_batch else None,
+                num_threads=int(num_threads) if num_threads else None,
                 download_timeout=download_timeout,
                 max_retries=max_retries,
                 retry_delay=retry_delay
             )
+            print(f"Устройство: {embedding_generator.device} ({embedding_generator.precision})")
             print(f"Размерность эмбеддингов: {embedding_generator.get_dimension()}")
     
     except ImportError as e:
@@ -128,12 +144,15 @@ def test_embeddings_generation():
     print(f"Обрабатываем {len(records)} записей...")
     print("[INFO] Это может занять некоторое время...")
     
+    cache = open_embedding_cache()
     try:
+        # Все тексты передаются генератору одним вызовом и кодируются батчами
         records_with_embeddings = add_embeddings_to_records(
             records,
             embedding_generator,
             text_field='text',
-            embedding_field='embedding'
+            embedding_field='embedding',
+            cache=cache
         )
         
         print(f"[OK] Эмбеддинги сгенерированы для {len(records_with_embeddings)} записей")
@@ -143,6 +162,9 @@ def test_embeddings_generation():
         import traceback
         traceback.print_exc()
         return
+    finally:
+        if cache is not None:
+            cache.close()
     
     # Проверяем результаты
     print("\n" + "-" * 60)
@@ -181,21 +203,24 @@ def test_embeddings_generation():
     print("СОХРАНЕНИЕ РЕЗУЛЬТАТОВ...")
     print("-" * 60)
     
-    # Сохраняем записи БЕЗ эмбеддингов в JSONL (для экономии места)
-    records_for_save = []
+    # Сохраняем записи БЕЗ эмбеддингов в JSONL (для экономии места).
+    # Записи больше не нужны в исходном виде, поэтому векторы извлекаются
+    # на месте (без копии каждой записи) в отдельный список - строки матрицы
+    # полных эмбеддингов
+    embeddings = []
     for record in records_with_embeddings:
-        record_copy = record.copy()
-        embedding = record_copy.pop('embedding', None)
+        embedding = record.pop('embedding', None)
         if embedding:
-            record_copy['has_embedding'] = True
-            record_copy['embedding_dimension'] = len(embedding)
+            record['has_embedding'] = True
+            record['embedding_dimension'] = len(embedding)
+            # Номер строки в матрице полных эмбеддингов (embeddings_full.npy)
+            record['embedding_row'] = len(embeddings)
+            embeddings.append(embedding)
             # Сохраняем только первые 3 значения для примера
-            record_copy['embedding_sample'] = embedding[:3]
-        records_for_save.append(record_copy)
+            record['embedding_sample'] = embedding[:3]
+    records_for_save = records_with_embeddings
     
-    with open(output_file, 'w', encoding='utf-8') as f:
-        for record in records_for_save:
-            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+    write_jsonl(records_for_save, output_file)
     
     print(f"[OK] Данные (без полных эмбеддингов) сохранены в: {output_file}")
     
@@ -203,10 +228,13 @@ def test_embeddings_generation():
     save_full = os.getenv('SAVE_FULL_EMBEDDINGS', 'false').lower() == 'true'
     
     if save_full:
-        full_output_file = Path(__file__).parent.parent / 'data/output/embeddings_full.json'
+        # Матрица float16 (строки - записи с эмбеддингами, см. embedding_row в JSONL)
+        # в разы компактнее JSON и читается без разбора: np.load(..., mmap_mode='r')
+        import numpy as np
+        
+        full_output_file = Path(__file__).parent.parent / 'data/output/embeddings_full.npy'
         print(f"\n[INFO] Сохранение полных эмбеддингов в {full_output_file.name}...")
-        with open(full_output_file, 'w', encoding='utf-8') as f:
-            json.dump(records_with_embeddings, f, ensure_ascii=False, indent=2)
+        np.save(full_output_file, np.asarray(embeddings, dtype=np.float16))
         print(f"[OK] Полные данные сохранены")
     else:
         print(f"\n[INFO] Полные эмбеддинги не сохраняются (установите SAVE_FULL_EMBEDDINGS=true для сохранения)")
@@ -216,7 +244,7 @@ def test_embeddings_generation():
         'total_records': len(records),
         'records_with_embeddings': len(records_with_emb),
         'records_without_embeddings': len(records_without_emb),
-        'embedding_dimension': len(records_with_emb[0]['embedding']) if records_with_emb else 0,
+        'embedding_dimension': len(embeddings[0]) if embeddings else 0,
         'provider': embedding_provider,
         'model': model_name if embedding_provider == 'sentence_transformers' else 'text-embedding-3-small'
     }
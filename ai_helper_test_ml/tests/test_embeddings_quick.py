@@ -6,6 +6,7 @@
 import json
 import sys
 import os
+from itertools import islice
 from pathlib import Path
 
 # Добавляем корневую директорию в путь для импорта
@@ -15,6 +16,8 @@ from rag_pipeline.embeddings import (
     create_embedding_generator,
     add_embeddings_to_records
 )
+from _embedding_cache import open_embedding_cache
+from _jsonl_io import iter_jsonl
 
 
 def test_embeddings_quick():
@@ -33,11 +36,8 @@ def test_embeddings_quick():
     
     # Загружаем только первые 3 записи для быстрого теста
     print(f"\n[INFO] Загрузка данных из {input_file.name}...")
-    records = []
-    with open(input_file, 'r', encoding='utf-8') as f:
-        for i, line in enumerate(f):
-            if line.strip() and i < 3:  # Только первые 3 записи
-                records.append(json.loads(line))
+    # Только первые 3 записи: остальной файл не читается
+    records = list(islice(iter_jsonl(input_file), 3))
     
     print(f"[OK] Загружено записей для теста: {len(records)}")
     
@@ -57,10 +57,14 @@ def test_embeddings_quick():
         embedding_generator = create_embedding_generator(
             provider="sentence_transformers",
             model_name=f'sentence-transformers/{model_name}',
-            device="cpu"
+            # GPU (cuda/mps) в fp16, если доступен, иначе cpu; на CPU
+            # EMBEDDING_PRECISION=int8 включает динамическую int8 квантизацию
+            device=os.getenv('EMBEDDING_DEVICE', 'auto'),
+            precision=os.getenv('EMBEDDING_PRECISION', 'auto')
         )
         
         print(f"[OK] Модель загружена")
+        print(f"[OK] Устройство: {embedding_generator.device} ({embedding_generator.precision})")
         print(f"[OK] Размерность эмбеддингов: {embedding_generator.get_dimension()}")
     
     except Exception as e:
@@ -74,12 +78,14 @@ def test_embeddings_quick():
     print("ГЕНЕРАЦИЯ ЭМБЕДДИНГОВ...")
     print("-" * 60)
     
+    cache = open_embedding_cache()
     try:
         records_with_embeddings = add_embeddings_to_records(
             records,
             embedding_generator,
             text_field='text',
-            embedding_field='embedding'
+            embedding_field='embedding',
+            cache=cache
         )
         
         print(f"[OK] Эмбеддинги сгенерированы для {len(records_with_embeddings)} записей")
@@ -89,6 +95,9 @@ def test_embeddings_quick():
         import traceback
         traceback.print_exc()
         return
+    finally:
+        if cache is not None:
+            cache.close()
     
     # Показываем результаты
     print("\n" + "-" * 60)
@@ -107,22 +116,36 @@ def test_embeddings_quick():
     output_file = Path(__file__).parent.parent / 'data/output/embeddings_quick_test.json'
     output_file.parent.mkdir(parents=True, exist_ok=True)
     
-    # Сохраняем с полными эмбеддингами для теста
+    # Полные эмбеддинги сохраняются матрицей float16 в .npy (в разы компактнее
+    # списков чисел в JSON, читается через np.load(..., mmap_mode='r')),
+    # в JSON остается номер строки матрицы
+    import numpy as np
+    
+    # Строки матрицы - только записи с эмбеддингом (при ошибке генерации
+    # вектор пустой); номер строки получают только они
+    embeddings = []
     output_data = []
     for record in records_with_embeddings:
+        embedding = record.get('embedding')
         record_copy = {
             'id': record['id'],
             'question': record['question'],
             'text': record['text'],
-            'embedding_dimension': len(record.get('embedding', [])),
-            'embedding': record.get('embedding', [])
+            'embedding_dimension': len(embedding) if embedding else 0
         }
+        if embedding:
+            record_copy['embedding_row'] = len(embeddings)
+            embeddings.append(embedding)
         output_data.append(record_copy)
     
+    embeddings_file = output_file.with_suffix('.npy')
+    np.save(embeddings_file, np.asarray(embeddings, dtype=np.float16))
+    
     with open(output_file, 'w', encoding='utf-8') as f:
         json.dump(output_data, f, ensure_ascii=False, indent=2)
     
     print(f"\n[OK] Результаты сохранены в: {output_file}")
+    print(f"[OK] Эмбеддинги (float16) сохранены в: {embeddings_file}")
     
     print("\n" + "=" * 60)
     print("[SUCCESS] Быстрый тест завершен!")
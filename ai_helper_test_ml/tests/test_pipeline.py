@@ -3,9 +3,50 @@
 Работает без подключения к векторным БД - только локальная обработка.
 """
 
-import json
+import os
+import sys
+from itertools import islice
 from rag_pipeline.data_cleaner import DataCleaner
 from rag_pipeline.text_chunker import TextChunker
+from _jsonl_io import iter_jsonl, write_json, write_jsonl
+
+# Сколько записей из rag_data.jsonl проверяет полный пайплайн
+_PIPELINE_SAMPLE_SIZE = 5
+
+
+def _save_pipeline_output(records: list, output_format: str) -> str:
+    """
+    Сохраняет результат полного пайплайна.
+    
+    Args:
+        records: Записи после чанкинга
+        output_format: 'json' - JSON с отступами (test_output.json),
+            'jsonl' - построчно без форматирования (test_output.jsonl),
+            'parquet' - колоночный Parquet со сжатием zstd (test_output.parquet,
+            требуется pyarrow): повторяющиеся category/section хранятся
+            словарным кодированием, колонки читаются без разбора JSON
+            
+    Returns:
+        Имя созданного файла
+    """
+    if output_format == 'parquet':
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("Для OUTPUT_FORMAT=parquet установите: pip install pyarrow")
+        output_file = 'test_output.parquet'
+        # Тип struct выводится по ключам всех записей: from_pylist берет колонки
+        # только из первой записи и теряет parent_id/chunk_index, если она не чанк
+        table = pa.Table.from_struct_array(pa.array(records))
+        pq.write_table(table, output_file, compression='zstd')
+    elif output_format == 'jsonl':
+        output_file = 'test_output.jsonl'
+        write_jsonl(records, output_file)
+    else:
+        output_file = 'test_output.json'
+        write_json(records, output_file)
+    return output_file
 
 
 def test_data_cleaning():
@@ -56,8 +97,11 @@ def test_data_cleaning():
     print(f"  Категорий: {len(stats['categories'])}")
     print(f"  Средняя длина вопроса: {stats['avg_question_length']:.1f} символов")
     
+    # Запись 2 отличается от записи 1 только пробелами и должна быть удалена
+    assert [record['id'] for record in cleaned] == ["1", "3"]
+    assert stats['total'] == 2
+    
     print("\n[OK] Тест очистки данных пройден")
-    return cleaned
 
 
 def test_chunking():
@@ -75,14 +119,14 @@ def test_chunking():
     опцию "Проверить баланс". В-третьих, вы можете использовать онлайн-банк. Войдите
     на сайт банка, откройте раздел со счетами и картами, и там будет отображен баланс.
     Также вы можете проверить баланс, позвонив в службу поддержки банка.
-    """
+    """.strip()
     
     test_record = {
         "id": "test_1",
         "question": "Как проверить баланс?",
         "category": "Общие операции",
-        "answer": long_text.strip(),
-        "text": f"Вопрос: Как проверить баланс?\nОтвет: {long_text.strip()}",
+        "answer": long_text,
+        "text": f"Вопрос: Как проверить баланс?\nОтвет: {long_text}",
         "section": "Общие операции"
     }
     
@@ -93,13 +137,27 @@ def test_chunking():
     
     print(f"Создано чанков: {len(chunks)}")
     
+    # Описание чанков собирается целиком и выводится одной записью в stdout
+    lines = []
     for i, chunk in enumerate(chunks, 1):
-        print(f"\nЧанк {i} (ID: {chunk['id']}):")
-        print(f"  Длина: {len(chunk['text'])} символов")
-        print(f"  Текст: {chunk['text'][:100]}...")
+        text = chunk['text']
+        lines.append(f"\nЧанк {i} (ID: {chunk['id']}):")
+        lines.append(f"  Длина: {len(text)} символов")
+        lines.append(f"  Текст: {text[:100]}...")
+    if lines:
+        print('\n'.join(lines))
+    
+    assert len(chunks) > 1
+    assert [chunk['chunk_index'] for chunk in chunks] == list(range(len(chunks)))
+    assert all(chunk['is_chunk'] and chunk['parent_id'] == "test_1" for chunk in chunks)
+    
+    # Адаптивное перекрытие (по длине текста) не увеличивает число чанков
+    adaptive_chunker = TextChunker(chunk_size=200, chunk_overlap=30, r_max=0.15)
+    adaptive_chunks = adaptive_chunker.chunk_record(test_record, enable_chunking=True)
+    print(f"\nЧанков с адаптивным перекрытием (r_max=0.15): {len(adaptive_chunks)}")
+    assert 1 < len(adaptive_chunks) <= len(chunks)
     
     print("\n[OK] Тест разбиения на чанки пройден")
-    return chunks
 
 
 def test_full_pipeline():
@@ -110,8 +168,8 @@ def test_full_pipeline():
     
     # Загружаем реальные данные если есть
     try:
-        with open('rag_data.jsonl', 'r', encoding='utf-8') as f:
-            records = [json.loads(line) for line in f if line.strip()]
+        # Читаются только первые записи, остальной файл не загружается
+        records = list(islice(iter_jsonl('rag_data.jsonl'), _PIPELINE_SAMPLE_SIZE))
         print(f"Загружено {len(records)} записей из rag_data.jsonl")
     except FileNotFoundError:
         print("[INFO] Файл rag_data.jsonl не найден, используем тестовые данные")
@@ -129,7 +187,7 @@ def test_full_pipeline():
     # Шаг 1: Очистка
     print("\n[1/2] Очистка данных...")
     cleaner = DataCleaner()
-    cleaned = cleaner.clean_records(records[:5], remove_duplicates=True)  # Тестируем на 5 записях
+    cleaned = cleaner.clean_records(records[:_PIPELINE_SAMPLE_SIZE], remove_duplicates=True)
     print(f"     Записей после очистки: {len(cleaned)}")
     
     # Шаг 2: Разбиение на чанки (только для длинных)
@@ -138,21 +196,31 @@ def test_full_pipeline():
     chunked = chunker.chunk_records(cleaned, enable_chunking=True)
     print(f"     Записей после чанкинга: {len(chunked)}")
     
-    # Сохраняем результат
-    output_file = 'test_output.json'
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(chunked, f, ensure_ascii=False, indent=2)
+    # Сохраняем результат в формате из OUTPUT_FORMAT (по умолчанию JSON)
+    output_file = _save_pipeline_output(chunked, os.getenv('OUTPUT_FORMAT', 'json').lower())
     print(f"\n[OK] Результат сохранен в {output_file}")
     
-    return chunked
+    assert 0 < len(cleaned) <= _PIPELINE_SAMPLE_SIZE
+    assert len(chunked) >= len(cleaned)
+    if output_file.endswith('.parquet'):
+        # В файле есть колонки всех ключей записей (включая поля только чанков)
+        import pyarrow.parquet as pq
+        assert set().union(*chunked) <= set(pq.read_schema(output_file).names)
 
 
 def main():
-    """Запуск всех тестов."""
+    """
+    Запуск всех тестов без pytest.
+    
+    Функции test_* не возвращают значений и проверяют результат через
+    assert, поэтому их также можно запускать через pytest.
+    """
     print("\n" + "=" * 60)
     print("ТЕСТИРОВАНИЕ RAG PIPELINE")
     print("=" * 60)
     
+    # Перехватывается только провал проверок; прочие исключения не
+    # маскируются и завершают запуск с полным traceback
     try:
         # Тест 1: Очистка данных
         test_data_cleaning()
@@ -162,15 +230,15 @@ def main():
         
         # Тест 3: Полный пайплайн
         test_full_pipeline()
-        
-        print("\n" + "=" * 60)
-        print("[SUCCESS] Все тесты пройдены успешно!")
-        print("=" * 60)
-        
-    except Exception as e:
-        print(f"\n[ERROR] Ошибка при тестировании: {e}")
+    except AssertionError:
+        print("\n[ERROR] Проверка теста не пройдена")
         import traceback
         traceback.print_exc()
+        sys.exit(1)
+    
+    print("\n" + "=" * 60)
+    print("[SUCCESS] Все тесты пройдены успешно!")
+    print("=" * 60)
 
 
 if __name__ == "__main__":